@@ -1,7 +1,29 @@
-from collections.abc import Callable
+from array import array
+from collections.abc import Callable, Hashable
 from dataclasses import dataclass
 
 
+@dataclass
+class DFATable:
+    # compact form of a DFA whose states are the integers 0..n-1, used by the lexer: state 0 is the dead state,
+    # each symbol is mapped to a column index (column 0 is reserved for the symbols outside the alphabet, which
+    # always lead to the dead state) and the transitions are stored row by row in a flat array of integers, so the
+    # next state of (state, symbol) is table[state * width + columns[symbol]]. several symbols can share a column,
+    # when they belong to the same class of symbols
+    columns: dict[str, int]
+    width: int
+    q0: int
+    table: array
+    F: set[int]
+
+    def next_state(self, state: int, symbol: str) -> int:
+        return self.table[state * self.width + self.columns.get(symbol, 0)]
+
+    def state_key(self, state: int) -> int:
+        # a value identifying the state (see Lexer.scan); the states of a DFATable never change, so it is the state
+        return state
+
+
 @dataclass
 class DFA[STATE]:
     S: set[str]
@@ -37,4 +59,95 @@ class DFA[STATE]:
         #               \-b-> (5) <-a,b-/
         #                   /     ⬉
         #                   \-a,b-/
-        pass
+        return DFA(S=set(self.S), K={f(state) for state in self.K}, q0=f(self.q0),
+                   d={(f(state), symbol): f(next_state) for (state, symbol), next_state in self.d.items()},
+                   F={f(state) for state in self.F})
+
+    def minimize(self, label: Callable[[STATE], Hashable] | None = None) -> 'DFA[frozenset[STATE]]':
+        # Hopcroft's algorithm: the states start grouped by their label (by default, whether they are final or not),
+        # so states with different labels are never merged, and the groups (blocks) are split until every state in a
+        # block goes to the same block on each symbol. each block of the final partition becomes a state of the new
+        # DFA. missing transitions are treated as transitions to an implicit sink state, which isn't part of the result
+        if label is None:
+            label = lambda state: state in self.F
+
+        sink = object()
+        symbols = [symbol for symbol in self.S if symbol]
+
+        # predecessors[symbol][state] = the states that go to state on symbol
+        predecessors = {symbol: {} for symbol in symbols}
+        for state in self.K:
+            for symbol in symbols:
+                next_state = self.d.get((state, symbol), sink)
+                predecessors[symbol].setdefault(next_state, []).append(state)
+        for symbol in symbols:
+            predecessors[symbol].setdefault(sink, []).append(sink)
+
+        # initial partition: one block for each label, plus a block for the sink
+        labels = {}
+        for state in self.K:
+            labels.setdefault(label(state), set()).add(state)
+        blocks = list(labels.values()) + [{sink}]
+        block_of = {state: index for index, block in enumerate(blocks) for state in block}
+
+        # every block but the largest one is used to split the others
+        largest = max(range(len(blocks)), key=lambda index: len(blocks[index]))
+        worklist = {index for index in range(len(blocks)) if index != largest}
+
+        while worklist:
+            splitter = list(blocks[worklist.pop()])
+            for symbol in symbols:
+                # states that go into the splitter on the current symbol, grouped by the block they belong to
+                touched = {}
+                for state in splitter:
+                    for previous_state in predecessors[symbol].get(state, ()):
+                        touched.setdefault(block_of[previous_state], set()).add(previous_state)
+
+                for index, inside in touched.items():
+                    if len(inside) == len(blocks[index]):
+                        continue
+                    # split the block: the states that go into the splitter get a new block
+                    blocks[index] -= inside
+                    blocks.append(inside)
+                    new_index = len(blocks) - 1
+                    for state in inside:
+                        block_of[state] = new_index
+                    # if the old block still has to be used as a splitter, the new one has to be used as well;
+                    # otherwise it is enough to use the smaller of the two
+                    if index in worklist or len(inside) <= len(blocks[index]):
+                        worklist.add(new_index)
+                    else:
+                        worklist.add(index)
+
+        # build the minimal DFA, using any state of a block to get the transitions of the block
+        new_states = {index: frozenset(block) for index, block in enumerate(blocks) if sink not in block}
+        d = {}
+        for index, new_state in new_states.items():
+            state = next(iter(new_state))
+            for symbol in symbols:
+                next_index = block_of[self.d.get((state, symbol), sink)]
+                if next_index in new_states:
+                    d[(new_state, symbol)] = new_states[next_index]
+
+        return DFA(S=set(symbols), K=set(new_states.values()), q0=new_states[block_of[self.q0]], d=d,
+                   F={new_state for new_state in new_states.values() if next(iter(new_state)) in self.F})
+
+    def to_table(self, classes: dict[str, str] | None = None) -> DFATable:
+        # the states of the DFA must already be the integers 0..n-1 (see remap_states), state 0 being the dead state;
+        # the epsilon symbol ('') is never part of the columns, as the DFA has no epsilon transitions.
+        # if the DFA was built over classes of symbols (see NFA.symbol_classes), classes maps every symbol to the
+        # representative of its class, and all the symbols of a class share the column of the representative
+        representatives = sorted(symbol for symbol in self.S if symbol)
+        columns = {symbol: index for index, symbol in enumerate(representatives, 1)}
+        width = len(columns) + 1
+        # every transition which is not defined goes to the dead state
+        table = array('i', bytes(array('i').itemsize * width * (max(self.K, default=0) + 1)))
+        for (state, symbol), next_state in self.d.items():
+            if symbol in columns:
+                table[state * width + columns[symbol]] = next_state
+
+        if classes is not None:
+            columns = {symbol: columns[representative] for symbol, representative in classes.items()
+                       if representative in columns}
+
+        return DFATable(columns=columns, width=width, q0=self.q0, table=table, F=set(self.F))
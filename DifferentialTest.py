@@ -0,0 +1,91 @@
+import contextlib
+import io
+import random
+import signal
+import sys
+
+from .Lexer import Lexer
+from .Parser import parse_program
+from .main import SPEC, create_output_string, process_tree, solve_tree
+
+# differential test of the modes of main which don't solve the tree the default way: random programs are solved with
+# solve_tree and processed with every mode, and the outputs must be the same. the programs for which solve_tree
+# raises an error or doesn't finish in TIMEOUT seconds (some programs never end) are skipped. run it with
+# python -m <package>.DifferentialTest [COUNT] [SEED], with 1000 programs and seed 0 by default
+
+MODES = [("--env",), ("--vm",), ("--memo",), ("--lazy",)]
+
+DEPTH = 5 # maximum depth of the random programs
+TIMEOUT = 1 # seconds a program can run
+
+def random_program(rng, depth, names=()):
+    # a random program of L, nested at most depth levels deep; names are the parameters which can be used
+    if depth == 0 or rng.random() < 0.2:
+        if names and rng.random() < 0.5:
+            return rng.choice(names)
+        return str(rng.randint(0, 9))
+    def elements(count):
+        return " ".join(random_program(rng, depth - 1, names) for _ in range(count))
+    choice = rng.random()
+    if choice < 0.15:
+        return "(+ (" + elements(rng.randint(1, 3)) + "))"
+    if choice < 0.3:
+        return "(++ (" + elements(rng.randint(1, 3)) + "))"
+    if choice < 0.55:
+        # a call of a (curried) lambda function
+        params = tuple(rng.choice("xyz") for _ in range(rng.choice((1, 1, 2, 2, 3))))
+        function = "".join("lambda %s: " % param for param in params) + random_program(rng, depth - 1, names + params)
+        return "(" + function + " " + elements(rng.randint(1, len(params) + 1)) + ")"
+    if choice < 0.6:
+        param = rng.choice("xyz")
+        return "lambda %s: %s" % (param, random_program(rng, depth - 1, names + (param,)))
+    return "(" + elements(rng.randint(0, 3)) + ")"
+
+class Timeout(Exception):
+    pass
+
+def raise_timeout(signum, frame):
+    raise Timeout()
+
+def run_program(lexer, text, options):
+    # the output of a program, the way main prints it, or the name of the error it raised
+    signal.alarm(TIMEOUT)
+    try:
+        tree = parse_program(lexer.scan(iter((text,)), skip={"SPACE"}))
+        if options is None:
+            return create_output_string(solve_tree(tree))
+        # the hits and misses of --memo are not printed
+        with contextlib.redirect_stderr(io.StringIO()):
+            return create_output_string(process_tree(tree, set(options)))
+    except Exception as error:
+        return "error: " + type(error).__name__
+    finally:
+        signal.alarm(0)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    signal.signal(signal.SIGALRM, raise_timeout)
+    lexer = Lexer(SPEC)
+    tested = 0
+    failed = {options: 0 for options in MODES}
+    for _ in range(count):
+        text = random_program(rng, DEPTH)
+        expected = run_program(lexer, text, None)
+        if expected.startswith("error: "):
+            # solve_tree raised an error or didn't finish
+            continue
+        tested += 1
+        for options in MODES:
+            output = run_program(lexer, text, options)
+            if output != expected:
+                if not failed[options]:
+                    print("%s: %s gives %s instead of %s" % (" ".join(options), text, output, expected))
+                failed[options] += 1
+    for options in MODES:
+        print("  %-10s  %5d programs  %5d wrong" % (" ".join(options), tested, failed[options]))
+    if any(failed.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
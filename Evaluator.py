@@ -0,0 +1,295 @@
+from collections import OrderedDict
+from . import Parser
+from .Parser import Node
+
+# evaluation engine based on environments. it follows solve_tree (main.py) step by step, with the same cases in the
+# same order, so it gives the same output, but a lambda function is applied without walking its body: instead of
+# replacing the parameter in the whole body (update_var), the binding (parameter -> argument) is added to the
+# environment of the body, and the bindings of a node are applied to its children only when the node is reached
+# (solved or printed), one level at a time. so applying a lambda function costs O(1), the parts of a body that are
+# never reached are never substituted, and the header of a lambda function is split into its parameters only once.
+# solve_tree puts the node of an argument in every place of its parameter and then changes that shared node in place,
+# so what a place shows depends on what was done to the others; the evaluator keeps the tree a tree instead: when an
+# argument that has children would be put in a second place (SharedValue), it gives up, and main.process_tree solves
+# the program with solve_tree. the evaluator runs its steps with run_steps, without the python call stack, so it can
+# be used for programs nested deeper than the recursion limit (see StressTest.py)
+
+def run_steps(steps):
+	# the recursive functions used to solve a tree (solve_tree and calculate_sum in main.py, solve_steps and sum_steps
+	# here) are written as generators: instead of calling each other, they yield the generator of the call they
+	# would make and they receive its result, so run_steps can run them with an explicit stack of generators instead
+	# of the python call stack, and programs can be nested deeper than the recursion limit
+	stack = [steps]
+	result = None
+	while stack:
+		try:
+			# resume the generator on top of the stack with the result of its last call
+			call = stack[-1].send(result)
+		except StopIteration as stop:
+			# the generator returned, so its result is sent to the generator that called it
+			stack.pop()
+			result = stop.value
+		else:
+			stack.append(call)
+			result = None
+	return result
+
+class SharedValue(Exception):
+	# raised when the argument of a lambda function, which has children, would be put in a second place of the tree
+	pass
+
+class Term:
+	# a node of the tree being solved: kind and data are the ones of a parse tree node (Parser.Node), except for the
+	# lambda functions, whose data is the tuple of their parameters. children is None until the children are needed:
+	# they are created from the children of source (the parse tree node of the term, which is never changed) the
+	# first time children() is called. env is the tuple of the bindings (in the order they were made) which still
+	# have to be applied to the children
+	__slots__ = ("kind", "data", "children", "env", "source")
+
+	def __init__(self, kind, data, children, env=(), source=None):
+		self.kind = kind
+		self.data = data
+		self.children = children
+		self.env = env
+		self.source = source
+
+	def expand(self):
+		# the terms of the children of the source node
+		return [term_of(child) for child in self.source.children]
+
+def term_of(node):
+	# the term of a parse tree node; the nodes without children get an empty tuple of children right away
+	data = tuple(node.data.split(" ")[1::2]) if node.kind == Parser.LAMBDA else node.data
+	return Term(node.kind, data, None if node.children else (), (), node)
+
+class Binding:
+	# a parameter bound to an argument; used is True once an argument with children was put in the tree
+	__slots__ = ("name", "value", "used")
+
+	def __init__(self, name, value):
+		self.name = name
+		self.value = value
+		self.used = False
+
+	def resolve(self):
+		# the term which replaces a variable of this binding. solve_tree would put the same node in every place of
+		# the variable, which is only safe for the terms that can't change (without children)
+		value = self.value
+		if value.children is None or value.children:
+			if self.used:
+				raise SharedValue(self.name)
+			self.used = True
+		return value
+
+def bind(term, env):
+	# applies the bindings of env, in order, to a term that replaces a child, the way update_var does for each of
+	# them: a variable of a binding is replaced with its argument (to which the next bindings are applied), a lambda
+	# function is skipped by the bindings of its parameters, and the other terms keep the bindings for their children
+	for i in range(len(env)):
+		if term.kind == Parser.VAR:
+			if term.data == env[i].name:
+				term = env[i].resolve()
+			continue
+		if term.children is None or term.children:
+			rest = env[i:]
+			if term.kind == Parser.LAMBDA:
+				rest = tuple(binding for binding in rest if binding.name not in term.data)
+			term.env += rest
+		break
+	return term
+
+def children(term):
+	# the children of a term, once the bindings of its environment are applied to them
+	if term.children is None:
+		term.children = term.expand()
+	if term.env:
+		env = term.env
+		term.env = ()
+		elems = term.children
+		for i in range(len(elems)):
+			elems[i] = bind(elems[i], env)
+	return term.children
+
+def apply_lambda(call):
+	# same as main.apply_lambda: the first parameter of the lambda function in call is bound to the first argument
+	elems = children(call)
+	function = elems[0]
+	params = function.data
+	var = params[0]
+	if var in params[1:]:
+		# a parameter used again in the next headers isn't replaced
+		var = ""
+	body = children(function)[0]
+	if body.kind == Parser.LAMBDA or body.kind == Parser.OPEN_BRACKET:
+		function.children[0] = bind(body, (Binding(var, elems[1]),))
+		return function.children[0]
+	if body.kind == Parser.VAR:
+		return elems[1] if body.data == var else body
+	if body.kind == Parser.NUM:
+		return body
+
+def solve_steps(term, memo=None):
+	# same as main.solve_tree_steps, on terms; the results of the closed lists are cached in memo if it is given
+	if term.kind == Parser.OPEN_BRACKET:
+		if memo is not None and term.children is None and id(term.source) in memo.closed:
+			return (yield memo.solve_steps(term))
+		elems = children(term)
+		# case 1: empty list
+		if not elems:
+			return term
+
+		# case 2: concatenation; the elements of the lists of the argument are solved, the others are kept as they are
+		if elems[0].kind == Parser.CONCAT:
+			result = []
+			for elem in children(children(elems[0])[0]):
+				if elem.kind == Parser.OPEN_BRACKET:
+					for list_elem in children(elem):
+						result.append((yield solve_steps(list_elem, memo)))
+				else:
+					result.append(elem)
+			return Term(Parser.OPEN_BRACKET, "(", result)
+
+		# case 3: addition
+		if elems[0].kind == Parser.ADD:
+			return Term(Parser.NUM, (yield sum_steps(elems[0], memo)), ())
+
+		# case 4: lambda function; with several headers, only the first parameter is bound and the call becomes the
+		# rest of the function, otherwise the result of the call is solved
+		if elems[0].kind == Parser.LAMBDA:
+			params = elems[0].data
+			if len(params) > 1:
+				term.kind = Parser.LAMBDA
+				term.data = params[1:]
+				term.children = [apply_lambda(term)]
+				return term
+			return (yield solve_steps(apply_lambda(term), memo))
+
+		# other lists: the elements are solved, and if one of them gives a lambda function, the list is solved again
+		for i in range(len(elems)):
+			elems[i] = yield solve_steps(elems[i], memo)
+			if elems[i].kind == Parser.LAMBDA:
+				return (yield solve_steps(term, memo))
+		return term
+
+	# other nodes: the children are solved
+	elems = children(term)
+	for i in range(len(elems)):
+		elems[i] = yield solve_steps(elems[i], memo)
+	return term
+
+def sum_steps(term, memo=None):
+	# same as main.calculate_sum_steps, on terms
+	term = yield solve_steps(term, memo)
+	total = 0
+	for i in range(len(children(term))):
+		elem = children(term)[i]
+		if elem.kind == Parser.NUM:
+			total += elem.data
+		elif elem.kind == Parser.OPEN_BRACKET or elem.kind == Parser.ADD:
+			total += yield sum_steps(elem, memo)
+		elif elem.kind == Parser.CONCAT:
+			if memo is not None:
+				# term is solved again, with the elements that were solved in place, but the memo gives copies of
+				# the cached results instead of changing the lists, so it gives up like for a shared value
+				raise SharedValue("++")
+			term = yield solve_steps(term)
+			total += yield sum_steps(term)
+	return total
+
+def term_tree(term):
+	# converts a term to a parse tree node (applying all the bindings left), so it can be printed with
+	# create_output_string; the term is walked with an explicit stack of (term, list of the children of its parent)
+	root = []
+	work = [(term, root)]
+	while work:
+		term, parent = work.pop()
+		data = "".join("lambda " + param + " " for param in term.data) if term.kind == Parser.LAMBDA else term.data
+		elems = children(term)
+		node = Node(term.kind, data, [] if elems else ())
+		parent.append(node)
+		work += [(elem, node.children) for elem in reversed(elems)]
+	return root[0]
+
+def copy_tree(tree):
+	# a copy of a tree created by the parser, in which no node is shared (see Parser.share_subtrees)
+	return term_tree(term_of(tree))
+
+class CopyTerm(Term):
+	# a copy of a cached result, whose children are copied from the result when they are needed (the result isn't
+	# changed, so it can be copied again)
+	__slots__ = ()
+
+	def __init__(self, term):
+		Term.__init__(self, term.kind, term.data, None, (), term)
+
+	def expand(self):
+		return [copy_term(child) for child in children(self.source)]
+
+def copy_term(term):
+	# a copy of a term of a cached result. the terms without children are never changed, so they are not copied, and
+	# a copy that wasn't expanded is the same as the term it was copied from
+	if term.children is not None and not term.children:
+		return term
+	while isinstance(term, CopyTerm) and term.children is None and not term.env:
+		term = term.source
+	return CopyTerm(term)
+
+class Memo:
+	# bounded LRU cache of the results of the closed lists (lists with children and without free variables, so their
+	# result doesn't depend on the bindings) of a tree whose equal subtrees are shared (see Parser.share_subtrees),
+	# keyed by the identity of their node. a cached result is never changed: every time the list is solved, the
+	# solver gets a copy of it
+	def __init__(self, size=4096):
+		self.size = size # maximum number of results kept
+		self.results = OrderedDict() # id of the node -> (node, result), the least recently used first
+		self.closed = set() # ids of the closed lists
+		self.hits = 0
+		self.misses = 0
+
+	def find_closed(self, tree):
+		# adds the closed lists of tree to self.closed. the tree is walked in post-order with an explicit stack of
+		# (node, children_visited), every shared node only once; free maps the id of a node to the names of its
+		# free variables
+		free = {}
+		stack = [(tree, False)]
+		while stack:
+			node, children_visited = stack.pop()
+			if id(node) in free:
+				continue
+			if not children_visited:
+				stack.append((node, True))
+				stack.extend((child, False) for child in node.children)
+				continue
+			if node.kind == Parser.VAR:
+				names = frozenset((node.data,))
+			else:
+				names = frozenset().union(*(free[id(child)] for child in node.children))
+				if node.kind == Parser.LAMBDA:
+					names = names.difference(node.data.split(" ")[1::2])
+				elif node.kind == Parser.OPEN_BRACKET and node.children and not names:
+					self.closed.add(id(node))
+			free[id(node)] = names
+
+	def solve_steps(self, term):
+		# solves a closed list which wasn't expanded, or copies its cached result
+		entry = self.results.get(id(term.source))
+		if entry is not None:
+			self.hits += 1
+			self.results.move_to_end(id(term.source))
+			return copy_term(entry[1])
+		self.misses += 1
+		term.children = term.expand()
+		result = yield solve_steps(term, self)
+		# the node is kept with its result, so its id can't be reused by another node while it is cached
+		self.results[id(term.source)] = (term.source, result)
+		if len(self.results) > self.size:
+			self.results.popitem(last=False)
+		return copy_term(result)
+
+def evaluate_tree(tree, memo=None):
+	# solves a tree created by the parser and returns the resulting tree, like solve_tree, without changing tree;
+	# raises SharedValue if the program has to be solved with solve_tree. if a Memo is given, the results of the
+	# closed lists are cached in it
+	if memo is not None:
+		memo.find_closed(tree)
+	return term_tree(run_steps(solve_steps(term_of(tree), memo)))
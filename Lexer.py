@@ -1,156 +1,423 @@
-from .Regex import parse_regex
+import hashlib
+import marshal
+import os
+import tempfile
+from array import array
+from concurrent.futures import Executor
+from functools import partial
+from operator import add
+from mmap import mmap
+from collections.abc import Container, Iterable, Iterator
+from typing import TextIO
+
+from .Regex import compile_regex
 from .NFA import NFA
-from .DFA import DFA
+from .DFA import DFA, DFATable
+
+# version of the compiled lexer format; it is part of the key of the cached lexers, so it has to be incremented
+# every time the way the table is built or stored changes
+LEXER_VERSION = 3
+
+# directory where Lexer.from_spec keeps the compiled lexers by default
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache")),
+                                 "l-interpreter")
+
+class LexerError(ValueError):
+    # raised by the consumers of the tokens (e.g. Parser.parse_program) when they reach the error token of the lexer
+    # ("", ERROR_MESSAGE); the message of the exception is the message of the token
+    pass
 
 class Lexer:
-    def __init__(self, spec: list[tuple[str, str]]) -> None:
+    def __init__(self, spec: list[tuple[str, str]], lazy: bool = False, max_states: int = 10000,
+                 bitset: bool = False, executor: Executor | None = None, keep_automata: bool = False) -> None:
         # initialisation converts the specification to a DFA which will be used in the lex method
         # the specification is a list of pairs (TOKEN_NAME:REGEX)
+        # with lazy=True, the DFA isn't built here: the lexer uses a LazyDFATable, whose states are built the first
+        # time the lexer reaches them, keeping at most max_states of them. with bitset=True, no DFA is used at all:
+        # the NFA is simulated with bitsets (see BitsetNFATable), for specs whose DFA would have too many states.
+        # once the table is built, the lexer only needs the table and state_tokens: the NFA (self.nfa), the DFA
+        # (self.dfa) and final_tokens are only kept with keep_automata=True, otherwise they are None, like for a lexer
+        # created by from_table
+        self.spec = spec
+        # the NFAs of the regexes are independent, so they can be built in parallel by an executor (a thread or
+        # process pool), numbered from 0, and shifted afterwards; without an executor, each one is numbered from the
+        # end of the previous one. either way, all the states of the resulting NFA are distinct integers. the regexes
+        # already compiled by this process are taken from the regex cache (see Regex.RegexCache), so only the new
+        # ones are parsed and converted to NFAs
+        if executor is not None:
+            nfas = list(executor.map(compile_regex, [regex for _, regex in spec]))
+
         S = set()
         K = {0}
         q0 = 0
-        d = dict()
+        d = {(0, ""): set()} # 0 is the initial state, it has an Epsilon transition to each of the old initial states
         F = set()
-        crt_tuple_nb = 0
-
-        for tuple in spec:
-            # for each tuple
-            nfa_crt_regex = parse_regex(tuple[1]).thompson() # create an NFA using the current regex
+        # final_tokens[state] = (index in the spec, token name) of the token matched by a final NFA state
+        final_tokens = {}
+        offset = 1
+        for index, (token, regex) in enumerate(spec):
+            if executor is None:
+                nfa_crt_regex = compile_regex(regex, offset)
+            else:
+                nfa_crt_regex = nfas[index].remap_states(partial(add, offset))
+            offset = max(nfa_crt_regex.K) + 1
 
-            # add the alphabet of the current NFA to the resulting NFA
+            # add the alphabet, the states and the transitions of the current NFA to the resulting NFA
             S |= nfa_crt_regex.S
+            K |= nfa_crt_regex.K
+            d.update(nfa_crt_regex.d)
+            d[(0, "")].add(nfa_crt_regex.q0)
+            # add final states of current NFA to the resulting NFA
+            F |= nfa_crt_regex.F
+            for final_state in nfa_crt_regex.F:
+                final_tokens[final_state] = (index, token)
 
-            # when creating the new NFA's states, we also save information about the tuple and the tuple number
-            for state in nfa_crt_regex.K:
-                K |= {((tuple, crt_tuple_nb), state)}
+        nfa = NFA(S, K, q0, d, F) # create the NFA
+        self.nfa = nfa if keep_automata else None
+        self.final_tokens = final_tokens if keep_automata else None
+        self.dfa = None
 
-            # create the new NFA's dictionary; 0 will be the initial state, it will have an Epsilon transition
-            # to each of the old initial states
-            if (0, "") not in d:
-                d[(0, "")] = {((tuple, crt_tuple_nb), nfa_crt_regex.q0)}
+        # characters with the same transitions in the whole NFA (e.g. most letters of [a-z]) are equivalent, so the
+        # DFA is built only over one representative of each class of characters, using subset construction
+        classes = nfa.symbol_classes()
+
+        if lazy or bitset:
+            # the token matched by a set of NFA states is the first defined token (lowest index in the spec) whose
+            # final NFA state is part of it
+            def label(subset):
+                return min((final_tokens[state] for state in subset if state in final_tokens), default=(0, None))[1]
+            if bitset:
+                self.table = nfa.bitset_table(classes, final_tokens)
             else:
-                d[(0, "")] |= {((tuple, crt_tuple_nb), nfa_crt_regex.q0)}
+                self.table = nfa.lazy_table(classes, label, max_states)
+            self.state_tokens = self.table.labels
+            return
 
-            for (state, transition) in nfa_crt_regex.d:
-                if (((tuple, crt_tuple_nb), state), transition) in d:
-                    # if the transition from this state already exists,
-                    # we add the remaining transitions to the next states in the current NFA to the resulting NFA
-                    d[(((tuple, crt_tuple_nb), state), transition)] |= set(((tuple, crt_tuple_nb), x) for x in (nfa_crt_regex.d[(state, transition)]))
-                else:
-                    # otherwise we add the transitions to the next states in the current NFA to the resulting NFA
-                    d[(((tuple, crt_tuple_nb), state), transition)] = set(((tuple, crt_tuple_nb), x) for x in nfa_crt_regex.d[(state, transition)])
-            # add final states of current NFA to the resulting NFA
-            for final_state in nfa_crt_regex.F:
-                F |= {((tuple, crt_tuple_nb), final_state)}
-            crt_tuple_nb += 1 # next NFA will be the one corresponding to crt_tuple_nb + 1
+        dfa = nfa.compress_symbols(classes).subset_construction()
+
+        # the token matched by a DFA state doesn't change once the DFA is built, so we compute it only once:
+        # for each final DFA state, we save the name of the first defined token (lowest index in the spec)
+        # whose final NFA state is part of it
+        dfa_tokens = {}
+        for dfa_state in dfa.F:
+            dfa_tokens[dfa_state] = min(final_tokens[elem] for elem in dfa_state if elem in final_tokens)[1]
+
+        # minimize the DFA; states that match different tokens are never merged
+        dfa = dfa.minimize(dfa_tokens.get)
+
+        # renumber the DFA states to dense integers, so that the lexer doesn't have to hash sets of NFA states:
+        # the states are numbered from 1, as 0 is the dead state, where the transitions missing from the DFA lead
+        # (a state holding the empty set of NFA states is a dead state as well, so it also becomes 0)
+        numbering = {}
+        states_nb = 1
+        for dfa_state in dfa.K:
+            if frozenset() in dfa_state:
+                numbering[dfa_state] = 0
+            else:
+                numbering[dfa_state] = states_nb
+                states_nb += 1
+        numbered_dfa = dfa.remap_states(numbering.__getitem__)
+        self.table = numbered_dfa.to_table(classes) # array-backed transition table used in the lex method
+        if keep_automata:
+            self.dfa = numbered_dfa
+
+        # state_tokens[state] is the name of the token matched by a final state and None for the other states
+        self.state_tokens = [None] * states_nb
+        for dfa_state in dfa.F:
+            self.state_tokens[numbering[dfa_state]] = dfa_tokens[next(iter(dfa_state))]
+
+    @classmethod
+    def from_spec(cls, spec: list[tuple[str, str]], cache_dir: str | None = None) -> 'Lexer':
+        # same as Lexer(spec), but the compiled table is cached on disk (in cache_dir, or DEFAULT_CACHE_DIR if it is
+        # not given), in a file named after a hash of the spec and of LEXER_VERSION; if the file exists and was saved
+        # for the same spec and version, the lexer is loaded from it, without building any automaton. the file is
+        # written with marshal, which only stores plain data (ints, strings, bytes, lists, dicts) and, unlike pickle,
+        # never runs any code when it is loaded, so a file put in the cache directory can't do more than give a wrong
+        # table
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        key = hashlib.sha256(repr((LEXER_VERSION, spec)).encode()).hexdigest()
+        path = os.path.join(cache_dir, "lexer-" + key + ".marshal")
+
+        try:
+            with open(path, "rb") as file:
+                saved = marshal.load(file)
+            if saved["version"] == LEXER_VERSION and saved["spec"] == spec:
+                return cls.from_table(spec, DFATable(columns=saved["columns"], width=saved["width"], q0=saved["q0"],
+                                                     table=array('i', saved["table"]), F=set(saved["F"])),
+                                      saved["state_tokens"])
+        except (OSError, EOFError, KeyError, TypeError, ValueError):
+            # the file is missing or can't be used => build the lexer and (re)write it
+            pass
+
+        lexer = cls(spec)
+        saved = {"version": LEXER_VERSION, "spec": spec, "columns": lexer.table.columns, "width": lexer.table.width,
+                 "q0": lexer.table.q0, "table": lexer.table.table.tobytes(), "F": sorted(lexer.table.F),
+                 "state_tokens": lexer.state_tokens}
+        try:
+            # write to a temporary file first, so that other processes never see a partially written file
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    marshal.dump(saved, file)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # the cache is only an optimisation, so a cache directory that can't be written is not an error
+            pass
 
-        self.nfa = NFA(S, K, q0, d, F) # create the NFA
+        return lexer
 
-        self.dfa = self.nfa.subset_construction() # convert NFA to DFA using subset construction
+    @classmethod
+    def from_table(cls, spec: list[tuple[str, str]], table: DFATable, state_tokens: list[str | None]) -> 'Lexer':
+        # creates a lexer from an already compiled table; such a lexer has no NFA or DFA, only the table used by lex
+        lexer = cls.__new__(cls)
+        lexer.spec = spec
+        lexer.nfa = None
+        lexer.dfa = None
+        lexer.final_tokens = None
+        lexer.table = table
+        lexer.state_tokens = state_tokens
+        return lexer
 
 
     def lex(self, word: str) -> list[tuple[str, str]] | None:
         # this method splits the lexer into tokens based on the specification and the rules described in the lecture
         # the result is a list of tokens in the form (TOKEN_NAME:MATCHED_STRING)
 
-        # if an error occurs and the lexing fails, you should return none # todo: maybe add error messages as a task
+        # if an error occurs and the lexing fails, the result is a list with a single token: ("", ERROR_MESSAGE)
         ret_list_tokens = [] # return value (a list of tuples / tokens)
-        row_count = 0 # var that keeps track of the number of rows in the word
-        col_count = 0 # var that keeps track of the number of columns in the word
-
-        crt_dfa_state = self.dfa.q0 # we start from the initial state of the DFA
-        char_index = 0 # index of current character in the string
-
-        # verify if first character of the string is in the alphabet or not
-        if (crt_dfa_state, word[char_index]) not in self.dfa.d:
-            return [("", "No viable alternative at character 0, line 0")]
-
-        crt_dfa_state = self.dfa.d[(crt_dfa_state, word[char_index])] # get current state in the DFA
-        crt_subword = ""
-        crt_verified_subword = ""
-
-        # for each symbol in the word
-        while char_index < word.__len__():
-            crt_subword += word[char_index] # add current character to the current sub-word
-
-            # if the first character of the string is '\n', increment row_count
-            if word[char_index] == "\n":
-                row_count += 1
-                if col_count > 0:
-                    col_count = -1
-
-            # search for the first defined pair given as argument using the position stored in each element;
-            # save the position only if the state is final in the NFA
-            list_of_final_states = [elem[0][1] for elem in crt_dfa_state if elem in self.nfa.F]
-            first_defined_pair = float('inf')
-            if list_of_final_states:
-                first_defined_pair = min(list_of_final_states)
-
-            for elem in crt_dfa_state:
-                if elem[0][1] == first_defined_pair and elem in self.nfa.F:
-                    # save the tuple that we checked in a variable
-                    prev_tuple = elem[0][0]
-                    crt_verified_subword = crt_subword # save current subword
-
-            # go to the next symbol in the string
-            char_index += 1
-            col_count += 1
-
-            if char_index < word.__len__():
-                # if the word didn't end yet:
-                if (crt_dfa_state, word[char_index]) not in self.dfa.d:
-                    # if current char was not defined as transition => invalid word
-                    return [("", "No viable alternative at character " + str(col_count) + ", line " + str(row_count))]
-
-                # get corresponding state to this last char's transition
-                crt_dfa_state = self.dfa.d[(crt_dfa_state, word[char_index])]
-
-                # if corresponding state is an empty frozenset
-                if crt_dfa_state == frozenset():
-                    if crt_verified_subword == "":
-                        # we reached a final state and we don't have any matching regex for this subword => we throw an error
-                        return [("", "No viable alternative at character " + str(col_count) + ", line " + str(row_count))]
-                    ret_list_tokens.append((prev_tuple[0], crt_verified_subword)) # append the last verified word to the list
-                    # go back to the first character that appears after the verified subword
-                    # and start searching for a maximum regex
-                    crt_subword = crt_subword[len(crt_verified_subword):]
-                    char_index -= len(crt_subword)
-
-                    # change row and column count based on what characters come before word[char_index]
-                    if col_count - len(crt_subword) >= 0:
-                        col_count -= len(crt_subword)
-                    else:
-                        col_count = 0
-                        row_count = 0
-                        for count in range(char_index):
-                            if word[count] == '\n':
-                                row_count += 1
-                                col_count = 0
-                            else:
-                                col_count += 1
-
-                    # we found the maximum possible regex for this subword, so we go to the first state in the DFA
-                    # and start searching a maximum regex for the next subword, starting with its first character
-                    crt_subword = ""
-                    crt_verified_subword = ""
-                    crt_dfa_state = self.dfa.d[(self.dfa.q0, word[char_index])]
-            elif char_index == word.__len__():
-                # we reached the end of the word
-                first_defined_pair_index = float('inf')
-                to_send = ""
-                if crt_dfa_state in self.dfa.F:
-                    # we are in a final state
-                    # we find the first defined regex that matches the end of the word
-                    for sub_state in crt_dfa_state:
-                        if sub_state in self.nfa.F:
-                            if first_defined_pair_index > sub_state[0][1]:
-                                first_defined_pair_index = sub_state[0][1]
-                                to_send = (sub_state[0][0][0], crt_verified_subword)
-
-                    # append the token to the return list
-                    ret_list_tokens.append(to_send)
-                else:
-                    # we didn't match any regex with the characters at the end of the word
-                    return [("", "No viable alternative at character EOF, line " + str(row_count))]
+        for token in self.scan(iter((word,))):
+            if token[0] == "":
+                return [token]
+            ret_list_tokens.append(token)
 
         return ret_list_tokens
+
+    def lex_stream(self, file: TextIO, chunk_size: int = 65536,
+                   skip: Container[str] = ()) -> Iterator[tuple[str, str]]:
+        # same tokens as the lex method, but the text is read from a file object, chunk_size characters at a time,
+        # and the tokens are yielded as soon as they are matched, so the whole program never has to be in memory;
+        # tokens whose name is in skip (e.g. {"SPACE"}) are not yielded. if the lexing fails, the last yielded token
+        # is the error, in the form ("", ERROR_MESSAGE)
+        return self.scan(iter(partial(file.read, chunk_size), ""), skip)
+
+    def scan(self, chunks: Iterator[str], skip: Container[str] = ()) -> Iterator[tuple[str, str]]:
+        # the maximal munch algorithm used by lex and lex_stream, over a text given as consecutive chunks of characters.
+        # the DFA is run from the start of the current token until it reaches the dead state or the end of the text,
+        # while saving the end of the last final state seen; that position is where the token ends and where the next
+        # token starts. the token text is only sliced when the token is emitted, and the row and column of the start of
+        # the current token are updated on every emitted token, so an error can be reported without scanning the text
+        # again.
+        # the DFA can read far past the end of a token without reaching a final state (with the spec A = a, B = a*b,
+        # the search of every "a" of "aaa...a" reads the whole rest of the text for B), which would make the lexer
+        # quadratic. so, as in Reps' algorithm, the pairs (state, position) reached after the end of a match are kept
+        # in failed: no final state can be reached from them, so a search stops as soon as it reaches one. a pair is
+        # added at most once, so the DFA makes at most (number of states) * (length of the text) steps in total
+        state_tokens = self.state_tokens
+        columns = self.table.columns
+        width = self.table.width
+        table = self.table.table
+        q0 = self.table.q0
+        state_key = self.table.state_key
+
+        buffer = "" # characters of the chunks read so far, starting at most with the current token
+        token_start = 0 # index in buffer of the first character of the current token
+        end_of_file = False
+        row_count = 0 # row of the first character of the current token
+        col_count = 0 # column of the first character of the current token
+        offset = 0 # position in the text of the first character of buffer
+        # failed[(key of a state, position in the text)] = position in the text where the search from that pair stops
+        # (the character which leads to the dead state, or the end of the text); there are no failed pairs after
+        # failed_end (an index in buffer)
+        failed = {}
+        failed_end = 0
+
+        while True:
+            if failed and token_start >= failed_end:
+                # the search never goes back, so the failed pairs can't be reached anymore
+                failed.clear()
+            # search for the longest prefix of the text which starts at token_start and matches a token;
+            # token_end is the end of the longest match found so far, matched_token the name of its token
+            crt_dfa_state = q0
+            char_index = token_start
+            token_end = -1
+            matched_token = None
+            failed_stop = None # where the search would stop, if it stopped at a failed pair
+
+            while True:
+                if char_index == len(buffer):
+                    if end_of_file:
+                        break
+                    # the current token may continue in the next chunk, so we keep only the text starting with the
+                    # current token and we add the next chunk to it
+                    chunk = next(chunks, "")
+                    if not chunk:
+                        end_of_file = True
+                        break
+                    buffer = buffer[token_start:] + chunk
+                    offset += token_start
+                    failed_end -= token_start
+                    char_index -= token_start
+                    if token_end != -1:
+                        token_end -= token_start
+                    token_start = 0
+
+                # get the next state; chars outside the alphabet go to the dead state
+                column = columns.get(buffer[char_index], 0)
+                next_dfa_state = table[crt_dfa_state * width + column]
+                if next_dfa_state <= 0:
+                    if next_dfa_state == 0:
+                        break
+                    # the transition wasn't built yet (lazy lexer)
+                    next_dfa_state = self.table.next_state(crt_dfa_state, column)
+                    if next_dfa_state == 0:
+                        break
+                crt_dfa_state = next_dfa_state
+                char_index += 1
+                if char_index <= failed_end:
+                    failed_stop = failed.get((state_key(crt_dfa_state), offset + char_index))
+                    if failed_stop is not None:
+                        break
+                if state_tokens[crt_dfa_state] is not None:
+                    # the state is final, so we save the token it matches and where it ends
+                    matched_token = state_tokens[crt_dfa_state]
+                    token_end = char_index
+
+            if matched_token is None:
+                if token_start == len(buffer):
+                    # there are no more characters to lex
+                    return
+                if failed_stop is not None:
+                    # the error is where the search that added the failed pair stopped
+                    char_index = failed_stop - offset
+                # no token matches the text starting at token_start
+                if char_index == len(buffer):
+                    yield ("", "No viable alternative at character EOF, line "
+                           + str(row_count + buffer.count("\n", token_start)))
+                else:
+                    # the error is reported at the character which couldn't be matched
+                    last_newline = buffer.rfind("\n", token_start, char_index)
+                    yield ("", "No viable alternative at character "
+                           + str(col_count + char_index - token_start if last_newline == -1
+                                 else char_index - last_newline - 1)
+                           + ", line " + str(row_count + buffer.count("\n", token_start, char_index)))
+                return
+
+            if char_index > token_end:
+                # the pairs reached after the end of the token are failed; their states are found again by running
+                # the DFA from the start of the token
+                stop = failed_stop if failed_stop is not None else offset + char_index
+                position = offset + token_start
+                for state in self.run_states(columns.get(symbol, 0) for symbol in buffer[token_start:char_index]):
+                    position += 1
+                    if position > offset + token_end:
+                        failed[(state_key(state), position)] = stop
+                failed_end = max(failed_end, char_index)
+
+            # the longest match is the token; update the position of the first character of the next token
+            newlines = buffer.count("\n", token_start, token_end)
+            if newlines:
+                row_count += newlines
+                col_count = token_end - buffer.rfind("\n", token_start, token_end) - 1
+            else:
+                col_count += token_end - token_start
+            if matched_token not in skip:
+                yield (matched_token, buffer[token_start:token_end])
+            token_start = token_end
+
+    def run_states(self, columns: Iterable[int]) -> Iterator[int]:
+        # the states the table goes through from its initial state when it reads the given columns (none of them may
+        # lead to the dead state); used to find again the states of a search, as the lexer doesn't keep them
+        width = self.table.width
+        table = self.table.table
+        crt_dfa_state = self.table.q0
+        for column in columns:
+            next_dfa_state = table[crt_dfa_state * width + column]
+            if next_dfa_state < 0:
+                next_dfa_state = self.table.next_state(crt_dfa_state, column)
+            crt_dfa_state = next_dfa_state
+            yield crt_dfa_state
+
+    def lex_spans(self, buffer: bytes | mmap, skip: Container[str] = ()) -> Iterator[tuple[str, int, int]]:
+        # bytes-level version of scan, for a program given as a bytes-like object (e.g. an mmap of the source file):
+        # the tokens are yielded as (TOKEN_NAME, START, END) offsets in buffer instead of copies of the matched text,
+        # so the text of a token is only materialized if the consumer asks for it (buffer[START:END]). the spec must
+        # only use ASCII characters, every other byte leads to the dead state. if the lexing fails, the last yielded
+        # span is ("", OFFSET, OFFSET), OFFSET being the byte which couldn't be matched (see error_message)
+        if any(ord(symbol) > 127 for symbol in self.table.columns):
+            raise ValueError("lex_spans can only be used with specs that use ASCII characters")
+
+        state_tokens = self.state_tokens
+        width = self.table.width
+        table = self.table.table
+        q0 = self.table.q0
+        state_key = self.table.state_key
+        # byte_columns[byte] is the column of the character with that code
+        byte_columns = [self.table.columns.get(chr(byte), 0) for byte in range(256)]
+
+        token_start = 0
+        buffer_len = len(buffer)
+        failed = {} # the failed pairs, as in scan (the positions are offsets in buffer)
+        failed_end = 0
+        while token_start < buffer_len:
+            if failed and token_start >= failed_end:
+                failed.clear()
+            # search for the longest match starting at token_start, the same way scan does
+            crt_dfa_state = q0
+            char_index = token_start
+            token_end = -1
+            matched_token = None
+            failed_stop = None
+            while char_index < buffer_len:
+                column = byte_columns[buffer[char_index]]
+                next_dfa_state = table[crt_dfa_state * width + column]
+                if next_dfa_state <= 0:
+                    if next_dfa_state == 0:
+                        break
+                    # the transition wasn't built yet (lazy lexer)
+                    next_dfa_state = self.table.next_state(crt_dfa_state, column)
+                    if next_dfa_state == 0:
+                        break
+                crt_dfa_state = next_dfa_state
+                char_index += 1
+                if char_index <= failed_end:
+                    failed_stop = failed.get((state_key(crt_dfa_state), char_index))
+                    if failed_stop is not None:
+                        break
+                if state_tokens[crt_dfa_state] is not None:
+                    matched_token = state_tokens[crt_dfa_state]
+                    token_end = char_index
+
+            if matched_token is None:
+                if failed_stop is not None:
+                    char_index = failed_stop
+                yield ("", char_index, char_index)
+                return
+
+            if char_index > token_end:
+                stop = failed_stop if failed_stop is not None else char_index
+                position = token_start
+                for state in self.run_states(byte_columns[byte] for byte in buffer[token_start:char_index]):
+                    position += 1
+                    if position > token_end:
+                        failed[(state_key(state), position)] = stop
+                failed_end = max(failed_end, char_index)
+
+            if matched_token not in skip:
+                yield (matched_token, token_start, token_end)
+            token_start = token_end
+
+
+def error_message(text: str | bytes | mmap, offset: int) -> str:
+    # the message of the error token for a text that couldn't be lexed at offset (len(text) if the text ended before
+    # a token could be matched), e.g. for the error spans of Lexer.lex_spans
+    newline = "\n" if isinstance(text, str) else b"\n"
+    row_count = text[:offset].count(newline)
+    if offset == len(text):
+        return "No viable alternative at character EOF, line " + str(row_count)
+    return ("No viable alternative at character " + str(offset - text.rfind(newline, 0, offset) - 1)
+            + ", line " + str(row_count))
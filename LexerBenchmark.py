@@ -0,0 +1,46 @@
+import time
+
+from .Lexer import Lexer
+from .main import SPEC
+
+# benchmark of maximal munch (Lexer.lex) on the worst cases of the algorithm, where the DFA reads far past the end of
+# every token before it reaches the dead state: for every case, the length of the text is doubled at each step, so
+# with linear lexing the time per character (the last column) stays about the same, for each kind of table.
+# run it with python -m <package>.LexerBenchmark
+
+CASES = [
+    # (name, spec, function building a text of length about n)
+    # every "a" is a token A, but B could match the whole rest of the text until its end
+    ("a*b after a", [("A", "a"), ("B", "a*b")], lambda n: "a" * n),
+    # the same, with a token that ends in the middle of a long failed search
+    ("(ab)*c after ab", [("AB", "ab"), ("B", "b"), ("C", "(ab)*c")], lambda n: "ab" * (n // 2)),
+    # a usual program, for comparison
+    ("program", SPEC, lambda n: ("(lambda xy: (++ (xy 12)) keyword1)\n" * (n // 35 + 1))[:n]),
+]
+
+SIZES = [2000, 4000, 8000, 16000, 32000]
+
+MODES = [("dfa", {}), ("lazy", {"lazy": True}), ("bitset", {"bitset": True})]
+
+def time_lex(lexer, text, repeat=3):
+    # the best time of a few runs, in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lexer.lex(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    for name, spec, build in CASES:
+        print(name)
+        for mode, options in MODES:
+            lexer = Lexer(spec, **options)
+            for n in SIZES:
+                text = build(n)
+                seconds = time_lex(lexer, text)
+                print("  %-6s  length = %6d  %9.3f ms  %7.3f us / char"
+                      % (mode, len(text), seconds * 1000, seconds * 1e6 / len(text)))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from .DFA import DFA
 
+from array import array
+from collections import deque
 from dataclasses import dataclass
 from collections.abc import Callable
 
@@ -16,69 +18,265 @@ class NFA[STATE]:
 
     def epsilon_closure(self, state: STATE) -> set[STATE]:
         epsilon_closure_set = {state}  # first element in the set is the initial state
-        queue = [state]  # we place initial state in a queue
+        queue = deque([state])  # we place initial state in a queue
 
         while queue:
-            crt_state = queue.pop(0) # pop first state in the queue
-            # for each state in the queue, get the states reachable by an EPSILON transition
-            epsilon_states = self.d.get((crt_state, EPSILON), set())
-            # for each reachable state, if it is not in the epsilon closure set,
-            # add it to the set and to the queue using filter and a lambda function
-            queue += filter(lambda state: not (state in epsilon_closure_set),
-                            list(epsilon_states))
-            epsilon_closure_set |= epsilon_states
+            crt_state = queue.popleft() # pop first state in the queue
+            # for each state in the queue, get the states reachable by an EPSILON transition;
+            # each reachable state which is not in the epsilon closure set yet is added to the set and to the queue
+            for epsilon_state in self.d.get((crt_state, EPSILON), ()):
+                if epsilon_state not in epsilon_closure_set:
+                    epsilon_closure_set.add(epsilon_state)
+                    queue.append(epsilon_state)
 
         return epsilon_closure_set
 
     def subset_construction(self) -> DFA[frozenset[STATE]]:
-        # get initial state of DFA using epsilon_closure on q0 of NFA; create sink state
-        dfa_initial_state = frozenset(self.epsilon_closure(self.q0))
+        # for each NFA state, save its transitions on symbols other than EPSILON, grouped by symbol, so that we only
+        # look at the symbols that actually have transitions from the current DFA state
+        moves = {}
+        for (state, symbol), next_states in self.d.items():
+            if symbol != EPSILON:
+                moves.setdefault(state, []).append((symbol, next_states))
 
-        queue = [dfa_initial_state]  # create queue for unvisited states
+        # the epsilon closure of every NFA state is computed only once, the first time it is needed
+        closures = {}
 
-        dfa_states = set()  # set in which we'll place the states for the resulting DFA
+        def closure(state: STATE) -> frozenset[STATE]:
+            if state not in closures:
+                closures[state] = frozenset(self.epsilon_closure(state))
+            return closures[state]
+
+        # get initial state of DFA using epsilon_closure on q0 of NFA
+        dfa_initial_state = closure(self.q0)
+
+        dfa_states = {dfa_initial_state}  # set in which we'll place the states for the resulting DFA
+        queue = deque([dfa_initial_state])  # create queue for unvisited states
         dfa_transitions = {}  # dictionary for the DFA transitions
 
         while queue:
-            crt_dfa_state = queue[0]  # get first unvisited DFA state from the queue
-
-            # for each symbol in the alphabet, go throught each substate in the DFA state,
-            # get next states
-            for symbol in self.S:
-                dfa_transitions.setdefault((crt_dfa_state, symbol), frozenset())
-                # get next states list for every NFA substate for current symbol using
-                # list comprehension
-                nfa_next_states = [state for nfa_state in crt_dfa_state
-                                   for state in self.d.get((nfa_state, symbol), frozenset())]
-                # use list comprehension so that we get all epsilon transition states
-                # from all next states, add it to the epsilon_states list, then
-                # concatenate with the value for the current key in the transitions
-                # dictionary
-                epsilon_states = [state for nfa_next_state in nfa_next_states
-                                    for state in self.epsilon_closure(nfa_next_state)]
-                dfa_transitions[(crt_dfa_state, symbol)] |= set(epsilon_states)
-
-                # if we have a transition from the current DFA state to another one,
-                # we add the next state to the queue if it wasn't already visited or if it
-                # isn't already in the queue; otherwise we create a transition from the
-                # current DFA state to the sink state
-                next_state = dfa_transitions[(crt_dfa_state, symbol)]
-                if next_state not in dfa_states and next_state not in queue:
-                    queue.append(frozenset(next_state))
-
-            # current state visited, so we pop it and we add it to the visited DFA states set
-            dfa_states.add(crt_dfa_state)
-            queue.pop(0)
-
-        # get final states using filter on a lambda function that searches if at least an NFA
-        # substate is part of the final NFA states
-        dfa_final_states = set(filter(lambda state: any(nfa_state in self.F
-                                                        for nfa_state in state), dfa_states))
-
-        return DFA(S=self.S, K=dfa_states, q0=dfa_initial_state,
+            crt_dfa_state = queue.popleft()  # get first unvisited DFA state from the queue
+
+            # go through each substate in the DFA state and gather, for every symbol, the epsilon closures of the
+            # states reachable on that symbol
+            next_nfa_states = {}
+            for nfa_state in crt_dfa_state:
+                for symbol, next_states in moves.get(nfa_state, ()):
+                    symbol_states = next_nfa_states.setdefault(symbol, set())
+                    for next_state in next_states:
+                        symbol_states |= closure(next_state)
+
+            # add the transitions of the current DFA state; the next states which weren't seen before are added to
+            # the queue. symbols with no transition lead to no state (the DFA doesn't have a sink state)
+            for symbol, symbol_states in next_nfa_states.items():
+                next_state = frozenset(symbol_states)
+                dfa_transitions[(crt_dfa_state, symbol)] = next_state
+                if next_state not in dfa_states:
+                    dfa_states.add(next_state)
+                    queue.append(next_state)
+
+        # the final states are the ones that contain at least a final NFA state
+        dfa_final_states = {state for state in dfa_states if not state.isdisjoint(self.F)}
+
+        return DFA(S=self.S - {EPSILON}, K=dfa_states, q0=dfa_initial_state,
                    d=dfa_transitions, F=dfa_final_states)
 
+    def lazy_table(self, classes: dict[str, str], label: 'Callable[[frozenset[STATE]], str | None]',
+                   max_states: int = 10000) -> 'LazyDFATable[STATE]':
+        # the DFA of subset_construction (over the classes of symbols, see symbol_classes) as a table whose states are
+        # only built when a lexer reaches them; label gives the name of the token matched by a set of NFA states
+        return LazyDFATable(self, classes, label, max_states)
+
+    def bitset_table(self, classes: dict[str, str], final_tokens: dict[STATE, tuple[int, str]]) -> 'BitsetNFATable':
+        # a table that simulates the NFA with bitsets instead of building a DFA (see BitsetNFATable); final_tokens
+        # maps every final state to (priority, token name), the lowest priority winning when several tokens match
+        return BitsetNFATable(self, classes, final_tokens)
+
+    def symbol_classes(self) -> dict[str, str]:
+        # two symbols are equivalent if every state has exactly the same transitions on both of them (e.g. most of
+        # the letters of [a-z]), so any automaton built from this NFA can't tell them apart. the result maps each
+        # symbol of the alphabet to the representative of its class (the smallest symbol in the class)
+        transitions = {}
+        for (state, symbol), next_states in self.d.items():
+            if symbol != EPSILON:
+                transitions.setdefault(symbol, set()).add((state, frozenset(next_states)))
+
+        representatives = {}
+        classes = {}
+        for symbol in sorted(transitions):
+            classes[symbol] = representatives.setdefault(frozenset(transitions[symbol]), symbol)
+        return classes
+
+    def compress_symbols(self, classes: dict[str, str]) -> 'NFA[STATE]':
+        # keeps only the transitions on the representatives of the symbol classes (see symbol_classes), as the
+        # transitions on the other symbols of a class are the same
+        return NFA(S={EPSILON} | set(classes.values()), K=self.K, q0=self.q0,
+                   d={(state, symbol): next_states for (state, symbol), next_states in self.d.items()
+                      if symbol == EPSILON or classes.get(symbol) == symbol},
+                   F=self.F)
+
     def remap_states[OTHER_STATE](self, f: 'Callable[[STATE], OTHER_STATE]') -> 'NFA[OTHER_STATE]':
         # optional, but may be useful for the second stage of the project. Works similarly to 'remap_states'
         # from the DFA class. See the comments there for more details.
-        pass
+        # (the lexer uses it to give the states of the NFAs of the spec different numbers, see Lexer.__init__). the
+        # result shares nothing with self, not even the alphabet, so it can be changed when self is a cached NFA
+        return NFA(S=set(self.S), K={f(state) for state in self.K}, q0=f(self.q0),
+                   d={(f(state), symbol): {f(next_state) for next_state in next_states}
+                      for (state, symbol), next_states in self.d.items()},
+                   F={f(state) for state in self.F})
+
+
+class LazyDFATable[STATE]:
+    # same layout as a DFATable (state 0 is the dead state, table[state * width + column] is the next state), but the
+    # DFA states are the sets of NFA states of subset construction, built the first time a transition reaches them,
+    # and the transitions that weren't computed yet are -1 in the table (see next_state). labels[state] is the name
+    # of the token matched by a state (None if it isn't final), like Lexer.state_tokens. once there are max_states
+    # states, the whole cache is cleared and the states are built again as they are reached, so the memory stays
+    # bounded. table and labels are only changed in place, so the references a lexer keeps to them stay valid
+    def __init__(self, nfa: NFA[STATE], classes: dict[str, str], label: 'Callable[[frozenset[STATE]], str | None]',
+                 max_states: int = 10000) -> None:
+        representatives = sorted(set(classes.values()))
+        representative_columns = {symbol: index for index, symbol in enumerate(representatives, 1)}
+        self.columns = {symbol: representative_columns[representative] for symbol, representative in classes.items()}
+        self.width = len(representatives) + 1
+        self.label = label
+        self.max_states = max(max_states, 3) # the dead state, the initial state and the state being built
+
+        # moves[nfa_state][column] = the NFA states reached from nfa_state on the symbols of the column
+        self.moves = {}
+        for (state, symbol), next_states in nfa.d.items():
+            if symbol != EPSILON and classes.get(symbol) == symbol:
+                self.moves.setdefault(state, {})[representative_columns[symbol]] = next_states
+        self.nfa = nfa
+        self.closures = {} # epsilon closures of the NFA states, computed once
+
+        self.table = array('i')
+        self.labels = []
+        self.subsets = [] # subsets[state] = the set of NFA states of a DFA state
+        self.numbers = {} # the number of each DFA state which is in the cache
+        self.resets = 0 # how many times the cache was cleared
+        self.reset()
+
+    def reset(self) -> None:
+        # clears the cache, keeping only the dead state (0) and the initial state (1)
+        del self.table[:]
+        del self.labels[:]
+        self.subsets.clear()
+        self.numbers.clear()
+        self.add_state(frozenset())
+        self.table[:self.width] = array('i', bytes(self.table.itemsize * self.width)) # the dead state never leaves itself
+        self.q0 = self.add_state(self.closure(self.nfa.q0))
+
+    def closure(self, state: STATE) -> frozenset[STATE]:
+        if state not in self.closures:
+            self.closures[state] = frozenset(self.nfa.epsilon_closure(state))
+        return self.closures[state]
+
+    def state_key(self, state: int) -> frozenset[STATE]:
+        # a value identifying the state even after the cache is cleared (see Lexer.scan): its set of NFA states
+        return self.subsets[state]
+
+    def add_state(self, subset: frozenset[STATE]) -> int:
+        # column 0 (symbols outside the alphabet) always leads to the dead state, the others aren't computed yet
+        number = len(self.subsets)
+        self.numbers[subset] = number
+        self.subsets.append(subset)
+        self.labels.append(self.label(subset) if subset else None)
+        self.table.append(0)
+        self.table.extend(array('i', [-1]) * (self.width - 1))
+        return number
+
+    def next_state(self, state: int, column: int) -> int:
+        # computes the transition of a state on a column, adding the next state to the cache if it isn't there. if
+        # the cache is full, it is cleared first, so the state numbers given before are no longer valid: only the
+        # returned state (and the initial state, which is always 1) can be used afterwards
+        subset = set()
+        for nfa_state in self.subsets[state]:
+            for next_state in self.moves.get(nfa_state, {}).get(column, ()):
+                subset |= self.closure(next_state)
+        subset = frozenset(subset)
+
+        number = self.numbers.get(subset)
+        if number is None:
+            if len(self.subsets) >= self.max_states:
+                self.reset()
+                self.resets += 1
+                number = self.numbers.get(subset)
+                return number if number is not None else self.add_state(subset)
+            number = self.add_state(subset)
+        self.table[state * self.width + column] = number
+        return number
+
+
+class BitsetNFATable:
+    # matcher that simulates the NFA directly, so no DFA is built at all and every character costs time linear in the
+    # number of active NFA states, whatever the spec: the NFA states are numbered 0..n-1 and a set of states is an int
+    # whose bit i is set if state i is in the set. succ[column][i] is the set of states reached from state i on the
+    # symbols of the column, including their epsilon closures, so one step only ORs the masks of the active states.
+    # it has the interface of LazyDFATable, but no transition is ever cached: the table has the dead state (0), the
+    # initial state (1) and two slots (2 and 3) that next_state fills in turn with the set of NFA states it reaches,
+    # so a lexer always gets a state that is different from the one it gave, and the memory used doesn't grow
+    def __init__(self, nfa: NFA, classes: dict[str, str], final_tokens: dict) -> None:
+        representatives = sorted(set(classes.values()))
+        representative_columns = {symbol: index for index, symbol in enumerate(representatives, 1)}
+        self.columns = {symbol: representative_columns[representative] for symbol, representative in classes.items()}
+        self.width = len(representatives) + 1
+
+        numbers = {state: number for number, state in enumerate(nfa.K)}
+        closure_masks = [0] * len(numbers)
+        for state, number in numbers.items():
+            for closure_state in nfa.epsilon_closure(state):
+                closure_masks[number] |= 1 << numbers[closure_state]
+
+        # succ[column] maps the number of an NFA state to the mask of its successors, for the states that have some;
+        # move_masks[column] is the set of those states, so the other active states are skipped at once
+        self.succ = [{} for _ in range(self.width)]
+        self.move_masks = [0] * self.width
+        for (state, symbol), next_states in nfa.d.items():
+            if symbol == EPSILON or classes.get(symbol) != symbol:
+                continue
+            column = representative_columns[symbol]
+            mask = 0
+            for next_state in next_states:
+                mask |= closure_masks[numbers[next_state]]
+            self.succ[column][numbers[state]] = self.succ[column].get(numbers[state], 0) | mask
+            self.move_masks[column] |= 1 << numbers[state]
+
+        # (mask of the final states of a token, token name), by priority
+        token_masks = {}
+        for state, (priority, token) in final_tokens.items():
+            token_masks[(priority, token)] = token_masks.get((priority, token), 0) | (1 << numbers[state])
+        self.token_masks = [(mask, token) for (_, token), mask in sorted(token_masks.items())]
+
+        self.q0 = 1
+        self.sets = [0, closure_masks[numbers[nfa.q0]], 0, 0] # the set of NFA states of each state of the table
+        self.labels = [None, self.label(self.sets[1]), None, None]
+        # column 0 (symbols outside the alphabet) leads to the dead state, the other transitions are always computed
+        row = array('i', [0]) + array('i', [-1]) * (self.width - 1)
+        self.table = array('i', [0]) * self.width + row * 3
+
+    def label(self, states: int) -> str | None:
+        # the name of the first token (by priority) that has a final state in the set
+        for mask, token in self.token_masks:
+            if states & mask:
+                return token
+        return None
+
+    def state_key(self, state: int) -> int:
+        # a value identifying the state (see Lexer.scan); the slots are reused, so it is the set of NFA states
+        return self.sets[state]
+
+    def next_state(self, state: int, column: int) -> int:
+        succ = self.succ[column]
+        active = self.sets[state] & self.move_masks[column]
+        reached = 0
+        while active:
+            lowest = active & -active
+            reached |= succ[lowest.bit_length() - 1]
+            active ^= lowest
+        if not reached:
+            return 0
+        slot = 3 if state == 2 else 2
+        self.sets[slot] = reached
+        self.labels[slot] = self.label(reached)
+        return slot
@@ -0,0 +1,146 @@
+from .Lexer import LexerError
+
+# kinds of the nodes of the parse tree: the names of the tokens are replaced with small ints, so the nodes are
+# smaller and comparing kinds is cheap
+START, NUM, VAR, OPEN_BRACKET, CLOSE_BRACKET, ADD, CONCAT, LAMBDA, LAMBDA_START = range(9)
+KIND_NAMES = ("START", "NUM", "VAR", "OPEN_BRACKET", "CLOSE_BRACKET", "ADD", "CONCAT", "LAMBDA", "LAMBDA_START")
+KINDS = {name: kind for kind, name in enumerate(KIND_NAMES)}
+
+# we will create a parse tree
+class Node:
+	# the nodes don't have a __dict__, only these three fields: kind is one of the kinds above and data is the number
+	# (an int) for NUM nodes, the name of the variable for VAR nodes, the header ("lambda x lambda y ... ") for LAMBDA
+	# nodes and the matched string for the other nodes. nodes without children share the same empty tuple, only the
+	# nodes that get children (lists, functions, lambda functions) have a list
+	__slots__ = ("kind", "data", "children")
+
+	def __init__(self, kind, data, children=()):
+		self.kind = kind
+		self.data = data
+		self.children = children
+
+	@classmethod
+	def from_token(cls, token, children=()):
+		# creates a node from a token (TOKEN_NAME, MATCHED_STRING) of the lexer; numbers are converted to int here,
+		# once, instead of every time they are used
+		kind = KINDS[token[0]]
+		return cls(kind, int(token[1]) if kind == NUM else token[1], children)
+
+	@property
+	def value(self):
+		# the node as (TOKEN_NAME, STRING), the way it is printed
+		return (KIND_NAMES[self.kind], str(self.data))
+
+	def __repr__(self, level=0):
+        # Helper function to print the tree (one node per line, indented by its level), using an explicit stack
+		lines = []
+		stack = [(self, level)]
+		while stack:
+			node, level = stack.pop()
+			lines.append("\t" * level + repr(node.value) + "\n")
+			stack.extend((child, level + 1) for child in reversed(node.children))
+		return "".join(lines)
+
+def parse_program(tokens):
+	# builds the parse tree of a program, whose root is a START node, from its tokens (without the SPACE tokens). the
+	# tokens can be any iterable (e.g. the generator returned by Lexer.lex_stream), they are read one at a time, and
+	# the nodes whose elements are still being parsed are kept on an explicit stack instead of the Python call stack,
+	# so long and deeply nested programs are parsed in linear time and without recursion. tokens that can't start an
+	# element are skipped. the whole text is lexed, even after the first element: if the lexer fails anywhere, the
+	# error token ("", MESSAGE) raises a LexerError with its message
+	tokens = checked_tokens(tokens)
+	token = next(tokens, None)
+	tree = Node(START, "START", []) # the root node will be "START"
+	# lists (OPEN_BRACKET nodes) and ADD / CONCAT nodes whose elements are being parsed
+	stack = []
+
+	while token is not None:
+		if token[0] == "CLOSE_BRACKET" and stack:
+			# the close bracket ends the arguments of an add / concat function (without being consumed,
+			# as it also closes the list of the function) or it closes the list on top of the stack
+			if stack.pop().kind == OPEN_BRACKET:
+				token = next(tokens, None)
+			if not stack:
+				break
+			continue
+
+		# the element is added to the node on top of the stack, or to the root if we are at the top level
+		parent = stack[-1] if stack else tree
+
+		if token[0] == "NUM" or token[0] == "VAR":
+			parent.children.append(Node.from_token(token)) # add num / var to the children list
+			token = next(tokens, None)
+
+		elif token[0] == "ADD" or token[0] == "CONCAT" or token[0] == "OPEN_BRACKET":
+			# we encounter an add / concat function or a list, its elements follow in the tokens
+			node = Node.from_token(token, [])
+			parent.children.append(node)
+			stack.append(node)
+			token = next(tokens, None)
+
+		elif token[0] == "LAMBDA":
+			# we encounter a lambda function, so we create a new custom node in the tree
+			# its value will be the lambda name and the name of the var
+			string = token[1] + " " + next(tokens)[1] + " "
+			next(tokens) # we skip the end of the lambda function (":")
+			token = next(tokens, None)
+			# if there are more lambda functions that follow it directly, we use them in order to create a single node
+			# for all of these lambda functions
+			while token is not None and token[0] == "LAMBDA":
+				string += token[1] + " " + next(tokens)[1] + " "
+				next(tokens) # skip ":"
+				token = next(tokens, None)
+			lambda_node = Node(LAMBDA, string, []) # create the lambda node
+			parent.children.append(lambda_node)
+			# parse what follows the lambda definition (function body)
+			if token is not None and token[0] == "OPEN_BRACKET":
+				node = Node.from_token(token, [])
+				lambda_node.children.append(node)
+				stack.append(node)
+				token = next(tokens, None)
+			elif token is not None and (token[0] == "NUM" or token[0] == "VAR"):
+				lambda_node.children.append(Node.from_token(token))
+				token = next(tokens, None)
+
+		else:
+			token = next(tokens, None)
+
+		if not stack:
+			# the first element of the program was parsed
+			break
+
+	# the tokens after the first element are not used, but a lexing error there still fails the program
+	for token in tokens:
+		pass
+	return tree
+
+def checked_tokens(tokens):
+	# the tokens, stopping with a LexerError at the error token of the lexer
+	for token in tokens:
+		if token[0] == "":
+			raise LexerError(token[1])
+		yield token
+
+def share_subtrees(tree, table=None):
+	# hash-consing: equal subtrees of the tree are replaced with a single node, so every distinct subtree exists only
+	# once (and the evaluators can recognize a repeated subtree by the identity of its node). table maps
+	# (kind, data, ids of the children) to the node kept for it; it can be given to share nodes between trees.
+	# solve_tree changes the nodes of the tree while it solves it, so it must not be used on a tree with shared nodes.
+	# the tree is walked in post-order with an explicit stack of (node, children_shared)
+	if table is None:
+		table = {}
+	shared = {} # id of a node of the tree -> the node kept for it
+	stack = [(tree, False)]
+	while stack:
+		node, children_shared = stack.pop()
+		if id(node) in shared:
+			continue
+		if not children_shared:
+			stack.append((node, True))
+			stack.extend((child, False) for child in node.children)
+			continue
+		if node.children:
+			node.children[:] = [shared[id(child)] for child in node.children]
+		key = (node.kind, node.data, tuple(id(child) for child in node.children))
+		shared[id(node)] = table.setdefault(key, node)
+	return shared[id(tree)]
@@ -1,239 +1,220 @@
-from .NFA import NFA
-
-crt_state = 0
-
-#function used for combining NFAs by sticking them together
-def combine_nfas(nfa_list):
-    combined_nfa = NFA(S={''}, K=set(), q0=nfa_list[0].q0,
-                d={}, F=set())
-
-    last_final_state = -1
-
-    for nfa in nfa_list:
-        # add states and alphabet of the current NFA to the resulting one
-        combined_nfa.S.update(nfa.S)
-        combined_nfa.K.update(nfa.K)
-
-        # add transsitions of the current NFA to the resulting one
-        for (state, symbol), next_states in nfa.d.items():
-            combined_nfa.d[(state, symbol)] = next_states
+from array import array
+from collections import OrderedDict
+from functools import partial
+from operator import add
+from threading import Lock
 
-        # connect the last and current NFAs with an Epsilon transition
-        if last_final_state != -1:
-            combined_nfa.d[(last_final_state, "")] = {nfa.q0}
-        
-        last_final_state = nfa.F.pop()
-
-    # add final state to the resulting NFA
-    combined_nfa.F = {last_final_state}
+from .NFA import NFA
 
-    return combined_nfa
+class NFABuilder:
+    # shared, growing storage for the NFAs built by one compilation, instead of a global state counter (so several
+    # regexes can be compiled at the same time, e.g. from different threads) and instead of one NFA object for every
+    # regex node: the fragment methods only reserve states and append edges to flat arrays, so every regex node costs
+    # O(1) amortized work (besides one edge for each character of a [c1-c2] class), and the NFA is built only once,
+    # by to_nfa. the states are numbered from start
+    def __init__(self, start: int = 0) -> None:
+        self.next = start # number of the next new state
+        # edge i goes from sources[i] to targets[i] on symbols[i]
+        self.sources = array('i')
+        self.symbols = []
+        self.targets = array('i')
+        # epsilon edge i goes from epsilon_sources[i] to epsilon_targets[i]
+        self.epsilon_sources = array('i')
+        self.epsilon_targets = array('i')
+
+    def new(self, count: int) -> int:
+        # reserves count consecutive states and returns the first one
+        first = self.next
+        self.next += count
+        return first
+
+    def edge(self, source: int, symbol: str, target: int) -> None:
+        self.sources.append(source)
+        self.symbols.append(symbol)
+        self.targets.append(target)
+
+    def epsilon(self, source: int, target: int) -> None:
+        self.epsilon_sources.append(source)
+        self.epsilon_targets.append(target)
+
+    def mark(self) -> tuple[int, int, int]:
+        # the current sizes of the builder, so to_nfa can take only what is added after this
+        return (self.next, len(self.sources), len(self.epsilon_sources))
+
+    def to_nfa(self, q0: int, final: int, mark: tuple[int, int, int] = (0, 0, 0)) -> NFA[int]:
+        # the NFA made of the states and edges added since mark, with the initial state q0 and the final state final
+        first_state, first_edge, first_epsilon = mark
+        d = {}
+        for i in range(first_edge, len(self.sources)):
+            d.setdefault((self.sources[i], self.symbols[i]), set()).add(self.targets[i])
+        for i in range(first_epsilon, len(self.epsilon_sources)):
+            d.setdefault((self.epsilon_sources[i], ''), set()).add(self.epsilon_targets[i])
+        return NFA(S={''} | set(self.symbols[first_edge:]), K=set(range(first_state, self.next)), q0=q0, d=d,
+                   F={final})
 
 # function that returns a list of characters alphabetically from char1 to char2
 def get_letters_interval(char1 : str, char2 : str):
     return [chr(i) for i in range(ord(char1), ord(char2) + 1)]
 
+class Regex:
+    __slots__ = ()
+
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        # adds the states and edges of the regex to builder and returns (initial state, final state) of the part of
+        # the NFA built for it; the final state never has edges going out of it, until an enclosing regex adds some
+        raise NotImplementedError('the fragment method of the Regex class should never be called')
+
+    def thompson(self, builder: NFABuilder | None = None) -> NFA[int]:
+        # the Thompson NFA of the regex, built with builder (a new one whose states start from 0 if it isn't given)
+        if builder is None:
+            builder = NFABuilder()
+        mark = builder.mark()
+        q0, final = self.fragment(builder)
+        return builder.to_nfa(q0, final, mark)
+
 # we use a tree structure in order to parse the regex
-class Node:
-    def __init__(self, data, children =[]):
+class Node(Regex):
+    __slots__ = ("data", "children") # the nodes don't need a __dict__
+
+    def __init__(self, data, children=None):
         self.data = data
-        self.children = children
+        self.children = [] if children is None else children # a new list for each node, not a shared default one
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-        nfa_list = []
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
         # Thompson is called; root node is "\\Concat"
-        if self.data == "\\Concat":
-            # verify if there is a union; if there is one, then we create the union between the child of "|" and the other nodes
-            # in this concatenation (it's a concatenation created specifically for the union)
-            if self.children[0].data == "|":
-                # we concatenate the rest of the children (1...n), as the tree wasn't created with them concatenated
-                nfa_list.append(Union(self.children[0].children[0], Node("\\Concat", self.children[1:len(self.children)])).thompson())
-            else:
-                # else:
-                # we can have another concatenation, so we call Thomspon on that as well
-                # or we can have a [c1-c2] situation, so we call the Thompson mwthod for that class
-                # or we can have a "*" situation, so again, we call the function for that class
-                # etc
-                for child in self.children:
-                    if child.data == "\\Concat":
-                        nfa_list.append(child.thompson())
-                    elif child.data[0] == "[":
-                        nfa_list.append(FromTo(child.data).thompson())
-                    elif child.data == "\\*":
-                        nfa_list.append(Star(child.children[0]).thompson())
-                    elif child.data == "\\?":
-                        nfa_list.append(Question(child.children[0]).thompson())
-                    elif child.data == "\\+":
-                        nfa_list.append(Plus(child.children[0]).thompson())
-                    else:
-                        nfa_list.append(Character(child.data).thompson())
-
-        # in the end, we combine all the resulting NFAs into one using the function combine_nfas
-        return combine_nfas(nfa_list)
-
-class Regex:
-    def thompson(self) -> NFA[int]:
-        raise NotImplementedError('the thompson method of the Regex class should never be called')
+        # verify if there is a union; if there is one, then we create the union between the child of "|" and the other nodes
+        # in this concatenation (it's a concatenation created specifically for the union)
+        if self.children and self.children[0].data == "|":
+            # we concatenate the rest of the children (1...n), as the tree wasn't created with them concatenated
+            return Union(self.children[0].children[0], Node("\\Concat", self.children[1:])).fragment(builder)
+
+        if not self.children:
+            # an empty concatenation matches the empty word
+            state = builder.new(1)
+            return state, state
+
+        # we build every child and we stick them together, with an Epsilon edge from the final state of each one to
+        # the initial state of the next one
+        q0, final = regex_of(self.children[0]).fragment(builder)
+        for child in self.children[1:]:
+            child_q0, child_final = regex_of(child).fragment(builder)
+            builder.epsilon(final, child_q0)
+            final = child_final
+        return q0, final
+
+def regex_of(node: Node) -> Regex:
+    # the regex a child of a concatenation stands for:
+    # we can have another concatenation, so we use the node itself
+    # or we can have a [c1-c2] situation, so we use the FromTo class
+    # or we can have a "*" situation, so we use the Star class
+    # etc
+    if node.data == "\\Concat":
+        return node
+    if node.data[0] == "[":
+        return FromTo(node.data)
+    if node.data == "\\*":
+        return Star(node.children[0])
+    if node.data == "\\?":
+        return Question(node.children[0])
+    if node.data == "\\+":
+        return Plus(node.children[0])
+    return Character(node.data)
 
 class Character(Regex):
     # Thomson for char: S0 --(char)--> S1
+    __slots__ = ("char",)
+
     def __init__(self, char: str):
         self.char = char
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-
-        nfa = NFA(S=set(self.char), K=set([crt_state, crt_state + 1]), q0=crt_state,
-                  d= {(crt_state, self.char): set([crt_state + 1])}, F=set([crt_state + 1]))
-        crt_state += 2
-        return nfa
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        crt_state = builder.new(2)
+        builder.edge(crt_state, self.char, crt_state + 1)
+        return crt_state, crt_state + 1
 
 class FromTo(Regex):
     # here we have a group of letters (transitions)
     # example: [a-z]; we have to get these letters and using the get_letters_interval function,
     # create an NFA using Thomson with 2 states and len(interval) transitions
+    __slots__ = ("char",)
+
     def __init__(self, char: str):
         self.char = char
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-
-        tranzitions = get_letters_interval(self.char[1], self.char[3])
-        d = {}
-        for tranzition in tranzitions:
-            d[(crt_state, tranzition)] = set([crt_state + 1])
-        nfa = NFA(S=set(tranzitions), K=set([crt_state, crt_state + 1]), q0=crt_state, d=d, F=set([crt_state + 1]))
-        crt_state += 2
-        return nfa
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        crt_state = builder.new(2)
+        for tranzition in get_letters_interval(self.char[1], self.char[3]):
+            builder.edge(crt_state, tranzition, crt_state + 1)
+        return crt_state, crt_state + 1
 
 class Star(Regex):
+    __slots__ = ("node",)
+
     def __init__(self, node: Node):
         self.node = node
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-
-        # verify if the node is the result of a concatenation, if so we call Thompson on the node and get the resulting NFA
-        if self.node.data == "\\Concat":
-            nfa = self.node.thompson()
-            # add 2 new states;
-            # we can go from previous final state to the new final state or to the previous initial state
-            # or we can go from the new initial state to the previous initial state or to the new final state
-            nfa.K.update({crt_state, crt_state + 1})
-            nfa.d[(nfa.F.pop(), "")] = {nfa.q0, crt_state + 1}
-            nfa.d[(crt_state, "")] = {nfa.q0, crt_state + 1}
-            nfa.q0 = crt_state # new initial state
-            nfa.F = {crt_state + 1} # new final state
-            crt_state += 2 # we added 2 new states
-            return nfa
-
-        if self.node.data[0] == "[":
-            # if the node contains a [c1-c2] type structure, find and add the transitions
-            tranzitions = get_letters_interval(self.node.data[1], self.node.data[3])
-            d = {}
-            d[(crt_state, "")] = set([crt_state + 1, crt_state + 3]) # init state goes to next state or final state
-            d[(crt_state + 2, "")] = set([crt_state + 1, crt_state + 3]) # penultimate state goes to second state or to the final state
-            for tranzition in tranzitions:
-                d[(crt_state + 1, tranzition)] = set([crt_state + 2]) # the [c1-c2] corresponding transitions
-            # create the NFA
-            nfa = NFA(S={''}.union(set(tranzitions)), K=set([crt_state, crt_state + 1, crt_state + 2, crt_state + 3]),
-                      q0=crt_state, d=d, F={crt_state + 3})
-        else:
-            # else if it is a symbol, create 4 states and 2 transitions (Epsilon + symbol transition)
-            # the dictionary is created the same way as it is in the if bracket
-            nfa = NFA(S={self.node.data, ''}, K=set([crt_state, crt_state + 1, crt_state + 2, crt_state + 3]), q0=crt_state,
-                      d= {(crt_state, ""): set([crt_state + 1, crt_state + 3]), (crt_state + 1, self.node.data): set([crt_state + 2]),
-                          (crt_state + 2, ""): set([crt_state + 1, crt_state + 3])}, F={crt_state + 3})
-        
-        crt_state += 4 # we added four new states
-        return nfa
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        # build the NFA of the node (a concatenation, a [c1-c2] class or a symbol), then add 2 new states:
+        # we can go from previous final state to the new final state or to the previous initial state
+        # or we can go from the new initial state to the previous initial state or to the new final state
+        q0, final = regex_of(self.node).fragment(builder)
+        crt_state = builder.new(2)
+        builder.epsilon(final, q0)
+        builder.epsilon(final, crt_state + 1)
+        builder.epsilon(crt_state, q0)
+        builder.epsilon(crt_state, crt_state + 1)
+        return crt_state, crt_state + 1
 
 class Question(Regex):
+    __slots__ = ("node",)
+
     def __init__(self, node: Node):
         self.node = node
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-
-        # verify if the node is the result of a concatenation, if so we call Thompson on the node and get the resulting NFA
-        if self.node.data == "\\Concat":
-            nfa = self.node.thompson()
-            # add a transition from the intial state to the final state
-            nfa.d.setdefault((nfa.q0, ""), set()).add(list(nfa.F)[-1])
-            return nfa
-
-        if self.node.data[0] == "[":
-            # if the node contains a [c1-c2] type structure, find and add the transitions
-            tranzitions = get_letters_interval(self.node.data[1], self.node.data[3])
-            d = {}
-            for tranzition in tranzitions:
-                d[(crt_state, tranzition)] = {crt_state + 1}
-            # add an Epsilon transition from the initial state to the final state
-            d[(crt_state, "")] = {crt_state + 1}
-            # create the NFA
-            nfa = NFA(S={''}.union(set(tranzitions)), K=set([crt_state, crt_state + 1]), q0=crt_state, d=d, F=set([crt_state + 1]))
-        else:
-            # else if it is a symbol, create 2 states and 2 transitions (Epsilon + symbol transition)
-            nfa = NFA(S={self.node.data, ''}, K=set([crt_state, crt_state + 1]), q0=crt_state, d= {(crt_state, self.node.data): set([crt_state + 1]), (crt_state, ""): set([crt_state + 1])}, F=set([crt_state + 1]))
-
-        crt_state += 2
-        return nfa
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        # build the NFA of the node and add an Epsilon transition from its initial state to its final state
+        q0, final = regex_of(self.node).fragment(builder)
+        builder.epsilon(q0, final)
+        return q0, final
 
 class Plus(Regex):
+    __slots__ = ("node",)
+
     def __init__(self, node: Node):
         self.node = node
 
-    def thompson(self) -> NFA[int]:
-        # concatenate regular NFA with a star type NFA of this node
-        # we will use Thompson on a Node object, and then on a Star object
-        return combine_nfas([Node("\\Concat", [self.node]).thompson(), Star(self.node).thompson()])
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        # the NFA of the node is built only once: from its final state we can go back to its initial state (to repeat
+        # it) or to a new final state. it is entered through a new initial state, so nothing else can reach the
+        # initial state of the node (e.g. the Epsilon transition of an enclosing Question isn't part of the loop)
+        q0, final = regex_of(self.node).fragment(builder)
+        crt_state = builder.new(2)
+        builder.epsilon(crt_state, q0)
+        builder.epsilon(final, q0)
+        builder.epsilon(final, crt_state + 1)
+        return crt_state, crt_state + 1
 
 class Union(Regex):
     # here we'll create a union of 2 NFAs
+    __slots__ = ("node1", "node2")
+
     def __init__(self, node1: Node, node2: Node):
         self.node1 = node1
         self.node2 = node2
 
-    def thompson(self) -> NFA[int]:
-        global crt_state
-
-        nfa_list = [self.node1.thompson(), self.node2.thompson()] # create the NFAs of both nodes
-        combined_nfa = NFA(S={''}, K=set(), q0=crt_state,
-                   d={}, F={crt_state + 1})
-
-        final_states = [] # final states for the 2 NFAs
-        initial_states = [] # initial states for the 2 NFAs
-
-        for nfa in nfa_list:
-            # add states and alphabet of the current NFA to the resulting one
-            combined_nfa.S.update(nfa.S)
-            combined_nfa.K.update(nfa.K)
-
-            # add transitions of the current NFA to the resulting one
-            for (state, symbol), next_states in nfa.d.items():
-                combined_nfa.d.setdefault((state, symbol), set()).update(next_states)
-
-            # add initial and final states of each NFA
-            initial_states.append(nfa.q0)
-            final_states.extend(list(nfa.F))
-
-        combined_nfa.K.update({crt_state, crt_state + 1}) # new initial and final state
-
-        # add transitions from the new initial state to the previous ones
-        combined_nfa.d[(combined_nfa.q0, "")] = {state for state in initial_states}
-
-        # add transitions from the old final states to the new one
-        for state in final_states:
-            combined_nfa.d[(state, "")] = {crt_state + 1}
-
-        crt_state += 2 # we added 2 new states, so increment crt_state counter
-        return combined_nfa
+    def fragment(self, builder: NFABuilder) -> tuple[int, int]:
+        # build the NFAs of both nodes, then add a new initial state, with Epsilon transitions to their initial
+        # states, and a new final state, with Epsilon transitions from their final states
+        q0_1, final_1 = self.node1.fragment(builder)
+        q0_2, final_2 = self.node2.fragment(builder)
+        crt_state = builder.new(2)
+        builder.epsilon(crt_state, q0_1)
+        builder.epsilon(crt_state, q0_2)
+        builder.epsilon(final_1, crt_state + 1)
+        builder.epsilon(final_2, crt_state + 1)
+        return crt_state, crt_state + 1
 
 def parse_regex(regex: str) -> Regex:
-    global crt_state
-    crt_state = 0
-    
     stack = []
     tree = Node("\\Concat", children=[])
     i = 0
@@ -292,3 +273,53 @@ def parse_regex(regex: str) -> Regex:
 
     tree.children.reverse() # reverse the children list
     return tree
+
+class RegexCache:
+    # process-wide LRU cache of compiled regexes: for each regex string, its Thompson NFA, whose states are numbered
+    # from 0, so the NFA can be reused at any offset (see compile_regex). at most max_size regexes are kept; hits and
+    # misses count the lookups. the cache can be used from several threads at once
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self.entries = OrderedDict() # regex -> NFA, the least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def lookup(self, regex: str) -> NFA[int]:
+        # the NFA of regex, compiled if it isn't in the cache. it is shared by all the lookups of the regex, so it is
+        # read-only: compile_regex gives a copy that can be changed (the parse tree isn't kept, so nothing mutable
+        # of it is shared)
+        with self.lock:
+            nfa = self.entries.get(regex)
+            if nfa is not None:
+                self.hits += 1
+                self.entries.move_to_end(regex)
+                return nfa
+            self.misses += 1
+
+        # the regex is compiled without holding the lock, so other regexes can be looked up meanwhile
+        nfa = parse_regex(regex).thompson()
+        with self.lock:
+            self.entries[regex] = nfa
+            self.entries.move_to_end(regex)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return nfa
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+# the cache used by compile_regex by default
+REGEX_CACHE = RegexCache()
+
+def compile_regex(regex: str, start: int = 0, cache: RegexCache | None = REGEX_CACHE) -> NFA[int]:
+    # builds the Thompson NFA of a regex, with its states numbered from start. the NFA is taken from cache (if it isn't
+    # None) and its states are shifted by start, which also makes a copy that the caller can change; every
+    # compilation has its own NFABuilder, so regexes can be compiled in parallel (it is a module level function, so a
+    # process pool can run it)
+    if cache is None:
+        return parse_regex(regex).thompson(NFABuilder(start))
+    return cache.lookup(regex).remap_states(partial(add, start))
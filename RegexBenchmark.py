@@ -0,0 +1,39 @@
+import time
+
+from .Regex import compile_regex
+
+# benchmark of the Thompson construction (parse_regex + thompson, without the regex cache) over long and deeply nested
+# regexes: for every family, the size of the regex is doubled at each step, so with linear compile time the time
+# per regex node (the last column) stays about the same. run it with python -m <package>.RegexBenchmark
+# (the nesting depths are kept under the python recursion limit, as thompson is recursive)
+
+FAMILIES = [
+    # (name, function building a regex of size n, sizes)
+    ("concatenation", lambda n: "ab" * n, [1000, 2000, 4000, 8000, 16000]),
+    ("classes and stars", lambda n: "[a-c]*x+" * n, [500, 1000, 2000, 4000, 8000]),
+    ("union chain", lambda n: "a|" * n + "a", [40, 80, 160, 320]),
+    ("nested stars", lambda n: "(" * n + "a" + ")*" * n, [40, 80, 160, 320]),
+    ("nested unions", lambda n: "(" * n + "a" + "|b)" * n, [40, 80, 160, 320]),
+    ("nested plus and question", lambda n: "(" * n + "a" + ")+b)?" * (n // 2), [40, 80, 160, 320]),
+]
+
+def time_compile(regex, repeat=5):
+    # the best time of a few compilations, in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compile_regex(regex, cache=None)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    for name, build, sizes in FAMILIES:
+        print(name)
+        for n in sizes:
+            regex = build(n)
+            seconds = time_compile(regex)
+            print("  n = %6d  length = %6d  %9.3f ms  %7.3f us / char"
+                  % (n, len(regex), seconds * 1000, seconds * 1e6 / len(regex)))
+
+if __name__ == '__main__':
+    main()
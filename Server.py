@@ -0,0 +1,188 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+from sys import argv
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from . import main
+from .Lexer import Lexer
+from .Parser import parse_program
+
+# long-running interpreter: the lexer is built once and kept warm in a pool of worker processes, and the programs
+# are received with a line protocol, over stdin / stdout or over a unix domain socket (several clients at once).
+# every line of a request is a whole program (L programs don't need newlines, they are spaces for the lexer) and
+# every response is one line: the output of the program, the same as create_output_string, or "error: MESSAGE".
+# the requests of a client can be pipelined: they are run concurrently and answered in the order they were sent.
+# the programs are run in worker processes so a program that runs for too long can be stopped: its worker is
+# killed and the pool is replaced (the other programs that were running in the old pool are run again)
+
+def run_source(text, options):
+	# runs a program received by the server in a worker process (with main.worker_lexer) and returns its output string
+	tokens = main.worker_lexer.scan(iter((text,)), skip={"SPACE"})
+	return main.create_output_string(main.process_tree(parse_program(tokens), options))
+
+class FileReader:
+	# reader of the lines of a file the event loop can't watch: every line is read by a thread of the default
+	# executor, and like a StreamReader with this limit, readline raises ValueError for a line longer than limit bytes
+	def __init__(self, file, limit):
+		self.file = file
+		self.limit = limit
+
+	async def readline(self):
+		line = await asyncio.get_running_loop().run_in_executor(None, self.file.readline, self.limit + 1)
+		if len(line) > self.limit and not line.endswith(b"\n"):
+			raise ValueError("line longer than %d bytes" % self.limit)
+		return line
+
+class Server:
+	def __init__(self, lexer, options=frozenset(), jobs=None, timeout=10.0, max_size=1 << 20):
+		self.lexer = lexer
+		self.options = options # options of main (e.g. "--vm") used to run the programs
+		self.jobs = jobs or os.cpu_count() or 1 # number of worker processes
+		self.timeout = timeout # seconds a program can run before its worker is killed
+		self.max_size = max_size # maximum length of a request line, in bytes
+		self.pool = self.create_pool()
+		self.running = None # semaphore limiting the programs given to the pool, created in the event loop
+
+	def create_pool(self):
+		# the workers get the compiled table of the lexer once, when they start (see main.init_worker). they start
+		# when the first programs are given to the pool, while the server has clients, so they aren't forked from the
+		# server: a forked worker would inherit the listening socket and the connections of the clients, and a
+		# connection closed by the server wouldn't reach the client as long as a worker keeps it open. the workers are
+		# forked from a forkserver (or spawned, where there is none), which only has the fds it was given
+		context = multiprocessing.get_context(
+			"forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+		return ProcessPoolExecutor(self.jobs, mp_context=context, initializer=main.init_worker,
+								   initargs=(self.lexer.spec, self.lexer.table, self.lexer.state_tokens))
+
+	def restart_pool(self, pool):
+		# kills the workers of pool (if it is still the current pool) and replaces it with a new one
+		if pool is not self.pool:
+			return
+		self.pool = self.create_pool()
+		# ProcessPoolExecutor has no public way to kill its workers, so this depends on its private _processes dict
+		# (pid -> Process) of CPython's concurrent.futures. if it isn't there, the workers are only shut down, and a
+		# program that doesn't stop keeps its worker busy until the server exits
+		for process in list((getattr(pool, "_processes", None) or {}).values()):
+			process.kill()
+		pool.shutdown(wait=False, cancel_futures=True)
+
+	async def run(self, text):
+		# runs a program and returns its response line. at most jobs programs are given to the pool at once, so the
+		# timeout only counts the time a program runs, not the time it waits for a worker
+		if self.running is None:
+			self.running = asyncio.Semaphore(self.jobs)
+		async with self.running:
+			while True:
+				pool = self.pool
+				try:
+					future = asyncio.wrap_future(pool.submit(run_source, text, self.options))
+					return await asyncio.wait_for(future, self.timeout)
+				except asyncio.TimeoutError:
+					self.restart_pool(pool)
+					return "error: timeout after %g seconds" % self.timeout
+				except BrokenProcessPool:
+					if pool is not self.pool:
+						continue # the pool was replaced because of another program, so this one is run again
+					self.restart_pool(pool)
+					return "error: worker stopped"
+				except Exception as error:
+					return "error: %s: %s" % (type(error).__name__, error)
+
+	async def serve_client(self, reader, write_line):
+		# reads the requests of a client and answers them in order; the responses are waited for by a separate task,
+		# so the client can send the next requests before the previous ones are answered. the queue holds the tasks
+		# running the requests (or the response itself, for the requests that are not run), then None at the end
+		responses = asyncio.Queue()
+
+		async def write_responses():
+			while True:
+				response = await responses.get()
+				if response is None:
+					return
+				await write_line(response if isinstance(response, str) else await response)
+
+		writer_task = asyncio.create_task(write_responses())
+		try:
+			while True:
+				try:
+					line = await reader.readline()
+				except (ValueError, asyncio.LimitOverrunError):
+					# the request is longer than max_size: it is answered and the connection is closed, as the rest
+					# of the line can't be told apart from the next request
+					await responses.put("error: request larger than %d bytes" % self.max_size)
+					break
+				if not line:
+					break
+				text = line.decode(errors="replace").rstrip("\n")
+				if text.strip():
+					await responses.put(asyncio.create_task(self.run(text)))
+		finally:
+			await responses.put(None)
+			await writer_task
+
+	async def serve_socket(self, path):
+		async def serve_connection(reader, writer):
+			async def write_line(response):
+				writer.write(response.encode() + b"\n")
+				await writer.drain()
+			try:
+				await self.serve_client(reader, write_line)
+			except ConnectionError:
+				pass
+			finally:
+				writer.close()
+
+		server = await asyncio.start_unix_server(serve_connection, path, limit=self.max_size)
+		async with server:
+			await server.serve_forever()
+
+	async def serve_stdin(self):
+		loop = asyncio.get_running_loop()
+		reader = asyncio.StreamReader(limit=self.max_size)
+		try:
+			await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+		except ValueError:
+			# the event loop can only watch pipes, sockets and terminals, not stdin redirected from a regular file
+			reader = FileReader(sys.stdin.buffer, self.max_size)
+
+		async def write_line(response):
+			sys.stdout.write(response + "\n")
+			sys.stdout.flush()
+
+		await self.serve_client(reader, write_line)
+
+	def close(self):
+		self.pool.shutdown(cancel_futures=True)
+
+def serve():
+	# usage: [OPTIONS] [--socket PATH] [--jobs N] [--timeout SECONDS] [--max-size BYTES], OPTIONS being the options
+	# of main that change how the programs are run; without --socket, the requests are read from stdin
+	args = argv[1:]
+	settings = {"--socket": None, "--jobs": None, "--timeout": "10", "--max-size": str(1 << 20)}
+	options = set()
+	while args:
+		arg = args.pop(0)
+		if arg in main.OPTIONS and arg != "--mmap":
+			options.add(arg)
+		elif arg in settings and args:
+			settings[arg] = args.pop(0)
+		else:
+			return
+
+	server = Server(Lexer.from_spec(main.SPEC), frozenset(options),
+					int(settings["--jobs"]) if settings["--jobs"] else None,
+					float(settings["--timeout"]), int(settings["--max-size"]))
+	try:
+		if settings["--socket"] is not None:
+			asyncio.run(server.serve_socket(settings["--socket"]))
+		else:
+			asyncio.run(server.serve_stdin())
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.close()
+
+if __name__ == '__main__':
+	serve()
@@ -0,0 +1,85 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# test of the server over a unix domain socket: a server is started in a subprocess, and clients send their requests,
+# half-close the connection and read the responses until the server closes it, which must happen once the last
+# request is answered (the worker processes must not keep the connections open). run it with
+# python -m <package>.ServerTest [CLIENTS], with 5 concurrent clients by default
+
+REQUESTS = [
+    # (request line, expected response line)
+    (b"(+ (1 2 3))", b"6"),
+    (b"(++ ((1 2) (3)))", b"( 1 2 3 )"),
+    (b"(lambda x: (+ (x 1)) 5)", b"6"),
+    (b"(1 #", b"error: LexerError: No viable alternative at character 3, line 0"),
+]
+
+TIMEOUT = 30 # seconds a client waits for the server before it fails
+
+def wait_for_socket(path, server):
+    # waits until the server listens on path
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(path)
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def run_client(path, results, index):
+    # sends all the requests, half-closes the connection and reads until the end of the file
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.settimeout(TIMEOUT)
+            client.connect(path)
+            client.sendall(b"".join(request + b"\n" for request, _ in REQUESTS))
+            client.shutdown(socket.SHUT_WR)
+            received = []
+            while True:
+                data = client.recv(65536)
+                if not data:
+                    break
+                received.append(data)
+        expected = b"".join(response + b"\n" for _, response in REQUESTS)
+        results[index] = "ok" if b"".join(received) == expected else "wrong responses %r" % b"".join(received)
+    except socket.timeout:
+        results[index] = "no end of file after %d seconds" % TIMEOUT
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    package = __spec__.parent
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "server.sock")
+        server = subprocess.Popen([sys.executable, "-m", package + ".Server", "--socket", path, "--jobs", "2"])
+        try:
+            if not wait_for_socket(path, server):
+                print("the server didn't start")
+                sys.exit(1)
+            failed = 0
+            for attempt in ("single client", "%d concurrent clients" % clients):
+                count = 1 if attempt == "single client" else clients
+                results = [None] * count
+                threads = [threading.Thread(target=run_client, args=(path, results, i)) for i in range(count)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                errors = [result for result in results if result != "ok"]
+                failed += len(errors)
+                print("%-22s %6.2f s  %s" % (attempt, time.perf_counter() - start, errors[0] if errors else "ok"))
+        finally:
+            server.kill()
+            server.wait()
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import resource
+import sys
+import time
+
+from .Lexer import Lexer
+from .Parser import parse_program
+from .main import SPEC, create_output_string, process_tree
+
+# stress test of deeply nested programs: every program is lexed, parsed, processed with the options of main and
+# printed, without raising the python recursion limit, and its output is checked. run it with
+# python -m <package>.StressTest [DEPTH], the depth being 1000000 by default.
+
+PROGRAMS = [
+    # (name, function building a program nested n levels deep, function giving its output)
+    ("nested lists", lambda n: "(" * n + "1" + ")" * n, lambda n: "( " * n + "1" + " )" * n),
+    ("nested sums", lambda n: "(+ (" * n + "1" + "))" * n, lambda n: "1"),
+]
+
+MODES = [(), ("--env",), ("--vm",), ("--memo",), ("--optimize",), ("--lazy",)]
+
+def run_program(lexer, text, options):
+    # the output of a program, the way main prints it
+    tree = parse_program(lexer.scan(iter((text,)), skip={"SPACE"}))
+    return create_output_string(process_tree(tree, set(options)))
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lexer = Lexer(SPEC)
+    failed = 0
+    for name, build, expected in PROGRAMS:
+        print(name)
+        text = build(depth)
+        output = expected(depth)
+        for options in MODES:
+            start = time.perf_counter()
+            try:
+                result = "ok" if run_program(lexer, text, options) == output else "wrong output"
+            except RecursionError:
+                result = "RecursionError"
+            seconds = time.perf_counter() - start
+            if result != "ok":
+                failed += 1
+            # ru_maxrss is in kilobytes on linux
+            print("  %-10s  depth = %8d  %8.2f s  peak RSS %6d MB  %s"
+                  % (" ".join(options) or "default", depth, seconds,
+                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024, result))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+from .Evaluator import Term, run_steps, solve_steps, term_tree
+from . import Parser
+
+# compilation of parse trees to flat code, run by the solver of the environment based evaluator (see Evaluator.py),
+# so the output is the one of solve_tree. a compiled program is a list of instructions (kind, data, end), one for
+# every node of the tree in preorder: kind and data are the ones of the node (the data of a lambda function is the
+# tuple of its parameters) and end is the index of the instruction after the last one of its subtree, so the
+# children of the node at index i start at i + 1 and each one ends where the next one starts. the instructions are
+# tuples of ints and strings only, so a compiled program can be saved with marshal or pickle and reused between runs
+
+class CodeTerm(Term):
+	# a term created from an instruction; source is its index and code the compiled program
+	__slots__ = ("code",)
+
+	def __init__(self, code, index):
+		kind, data, end = code[index]
+		Term.__init__(self, kind, data, None if end > index + 1 else (), (), index)
+		self.code = code
+
+	def expand(self):
+		# the terms of the children of the instruction
+		code = self.code
+		children = []
+		i = self.source + 1
+		end = code[self.source][2]
+		while i < end:
+			children.append(CodeTerm(code, i))
+			i = code[i][2]
+		return children
+
+def compile_tree(tree):
+	# compiles a tree created by the parser. the tree is walked with an explicit stack of nodes and of the indexes of
+	# the instructions whose subtree was compiled, so their end can be set
+	code = []
+	work = [tree]
+	while work:
+		node = work.pop()
+		if isinstance(node, int):
+			kind, data, _ = code[node]
+			code[node] = (kind, data, len(code))
+			continue
+		# the header of a lambda function is "lambda x lambda y ... ", so the parameters are every second word
+		data = tuple(node.data.split(" ")[1::2]) if node.kind == Parser.LAMBDA else node.data
+		work.append(len(code))
+		code.append((node.kind, data, None))
+		work += reversed(node.children)
+	return code
+
+def run(code):
+	# runs a compiled program and returns the resulting tree; raises Evaluator.SharedValue like evaluate_tree
+	return term_tree(run_steps(solve_steps(CodeTerm(code, 0))))
+
+def run_tree(tree):
+	# same as Evaluator.evaluate_tree, but the tree is compiled first
+	return run(compile_tree(tree))
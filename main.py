@@ -1,266 +1,578 @@
+import mmap
+import multiprocessing
+import os
+import sys
 from sys import argv
-from .Lexer import Lexer
-
-# we will create a parse tree
-class Node:
-	def __init__(self, value, children=[]):
-		self.value = value
-		self.children = children
-
-	def __repr__(self, level=0):
-        # Helper function to recursively print the tree
-		ret = "\t" * level + repr(self.value) + "\n"
-		for child in self.children:
-			ret += child.__repr__(level + 1)
-		return ret
-
-	def parse_tokens(self, tokens):
-		if tokens:
-			if tokens[0][0] == "NUM":
-				self.children.append(Node(tokens.pop(0))) # add num to the children list
-
-			elif tokens[0][0] == "VAR":
-				self.children.append(Node(tokens.pop(0))) # add var to the children list
-
-			elif tokens[0][0] == "ADD" or tokens[0][0] == "CONCAT":
-				# we encounter an add / concat function
-				node = Node(tokens.pop(0), [])
-				# create the tree recursively based on what follows in the tokens list
-				while tokens:
-					if (tokens[0][0] == "NUM"):
-						node.children.append(Node(tokens.pop(0)))
-					elif tokens[0][0] == "OPEN_BRACKET":
-						node.parse_tokens(tokens)
-					elif tokens[0][0] == "CLOSE_BRACKET":
-						break
-				self.children.append(node)
-
-			elif tokens[0][0] == "OPEN_BRACKET":
-				# if we encounter an open bracket, we create a new node,
-				# we put all elements in the bracket in its children list
-				node = Node(tokens.pop(0), [])
-				while tokens:
-					if (tokens[0][0] == "CLOSE_BRACKET"):
-						# close the bracket for the list
-						tokens.pop(0)
-						break
-					else:
-						# else if we encounter something else (e.g. lambda function),
-						# we call this recursive function again
-						node.parse_tokens(tokens)
-				self.children.append(node)
-
-			elif tokens[0][0] == "LAMBDA":
-				# we encounter a lambda function, so we create a new custom node in the tree
-				# its value will be the lambda name and the name of the var
-				string = tokens.pop(0)[1] + " " + tokens.pop(0)[1] + " "
-				tokens.pop(0) # we pop the end of the lambda function (":")
-				# if there are more lambda functions that follow it directly, we use them in order to create a single node
-				# for all of these lambda functions
-				while tokens[0][0] == "LAMBDA":
-					string += tokens.pop(0)[1] + " " + tokens.pop(0)[1] + " "
-					tokens.pop(0) # pop ":"
-				lambda_node = Node(("LAMBDA", string), []) # create the lambda node
-				# parse what follows the lambda definition (function body)
-				if tokens[0][0] == "OPEN_BRACKET":
-					lambda_node.parse_tokens(tokens)
-				elif tokens[0][0] == "NUM" or tokens[0][0] == "VAR":
-					lambda_node.children.append(Node(tokens[0], []))
-					tokens.pop(0) # pop the token
-				self.children.append(lambda_node)
+from concurrent.futures import ProcessPoolExecutor
+from .Lexer import Lexer, LexerError, error_message
+from .Parser import Node, parse_program, share_subtrees, NUM, VAR, OPEN_BRACKET, ADD, CONCAT, LAMBDA
+from .Evaluator import Memo, SharedValue, copy_tree, evaluate_tree, run_steps
+from .VM import run_tree
 
 # function that calcules the sum of some numbers / list of numbers
-def calculate_sum(child):
+def calculate_sum_steps(child, lazy=False):
 	new_children_sum = 0 # initial value is 0
 
 	# solve all lambda functions inside this add function's arguments
-	child = solve_tree(child)
+	child = (yield solve_tree_steps(child, lazy))
+	if type(child) is ConcatResult and child.elements is None:
+		# the concatenation of numbers and lists of them, whose sum is known
+		return child.total
 
 	# add all elements
 	for i in range(len(child.children)):
 		c = child.children[i]
-		if c.value[0] == "NUM":
-			new_children_sum += int(c.value[1]) # add number
-		elif c.value[0] == "OPEN_BRACKET":
-			new_children_sum += calculate_sum(c) # calculate sum of list elements
-		elif c.value[0] == "ADD":
-			new_children_sum += calculate_sum(c)
-		elif c.value[0] == "CONCAT":
+		if c.kind == NUM:
+			new_children_sum += c.data # add number
+		elif c.kind == OPEN_BRACKET:
+			new_children_sum += (yield calculate_sum_steps(c, lazy)) # calculate sum of list elements
+		elif c.kind == ADD:
+			new_children_sum += (yield calculate_sum_steps(c, lazy))
+		elif c.kind == CONCAT:
 			# encountered a concat function, we solve it first, and then we add the resulting elements
-			child = solve_tree(child)
-			new_children_sum += calculate_sum(child)
+			child = (yield solve_tree_steps(child, lazy))
+			new_children_sum += (yield calculate_sum_steps(child, lazy))
 
 	return new_children_sum
 
-# function used to change a variable's name with its value (recursively)
+def calculate_sum(child):
+	return run_steps(calculate_sum_steps(child))
+
+class ConcatResult(Node):
+	# the result of a concat function whose argument has only numbers and lists of them (see data_sum), made by
+	# solve_tree with lazy=True: total is the sum of the numbers in it, and the list of its elements is only built
+	# the first time the children are needed (e.g. to print the result), so (+ (++ (...))) doesn't build it. the
+	# elements are never changed by solve_tree, so the list is the same as the one solve_tree builds right away
+	__slots__ = ("concat_arg", "total", "elements")
+
+	def __init__(self, concat_arg, total):
+		self.kind = OPEN_BRACKET
+		self.data = "("
+		self.concat_arg = concat_arg
+		self.total = total
+		self.elements = None
+
+	@property
+	def children(self):
+		if self.elements is None:
+			self.elements = []
+			for elem_to_concat in self.concat_arg.children:
+				if elem_to_concat.kind == OPEN_BRACKET:
+					self.elements.extend(elem_to_concat.children)
+				else:
+					self.elements.append(elem_to_concat)
+		return self.elements
+
+	@children.setter
+	def children(self, children):
+		self.elements = children
+
+def data_sum(nodes):
+	# the sum of the numbers in the subtrees of nodes, or None if they have other nodes than numbers and lists. the
+	# subtrees are walked with a stack of iterators, so only the path to the current node is kept
+	total = 0
+	stack = [iter(nodes)]
+	while stack:
+		node = next(stack[-1], None)
+		if node is None:
+			stack.pop()
+		elif node.kind == NUM:
+			total += node.data
+		elif type(node) is ConcatResult and node.elements is None:
+			total += node.total
+		elif node.kind == OPEN_BRACKET:
+			stack.append(iter(node.children))
+		else:
+			return None
+	return total
+
+# function used to change a variable's name with its value (in the whole subtree of node)
 def update_var(node, var_to_change, value_to_change):
-	for i in range(len(node.children)):
+	# the tree is walked with an explicit stack of (node, index of the child, child, child_visited), in the same order
+	# as a recursive walk: the subtree of a child is updated before the child itself is replaced
+	stack = [(node, 0, None, False)]
+	while stack:
+		node, i, child, child_visited = stack.pop()
+		if child_visited:
+			# the subtree of the child was updated; replace the child if it is the variable
+			if child.kind == VAR and child.data == var_to_change:
+				node.children[i] = value_to_change
+			stack.append((node, i + 1, None, False))
+			continue
+		if i >= len(node.children):
+			continue
 		child = node.children[i]
 		# if we encounter another lambda function that uses the same parameter name
 		# we pass; dont update with value inside that function
-		dont_update = False
-		if child.value[0] == "LAMBDA":
-			for j in range(1, len(child.value[1].split(" ")), 2):
-				if child.value[1].split(" ")[j] == var_to_change:
-					dont_update = True
-		if dont_update:
+		if child.kind == LAMBDA and var_to_change in child.data.split(" ")[1::2]:
+			stack.append((node, i + 1, None, False))
 			continue
 		# we didnt find another function with the same parameter name => it's safe to update
-		update_var(child, var_to_change, value_to_change) # recursivity
-		if child.value[0] == "VAR" and child.value[1] == var_to_change:
-			node.children[i] = value_to_change
+		stack.append((node, i, child, True))
+		stack.append((child, 0, None, False))
 
 # applies a lambda function
 def apply_lambda(open_bracket_node):
 	lambda_node = open_bracket_node.children[0] # get lambda node
-	var = lambda_node.value[1].split(" ")[1] # get variable name
-	if (len(lambda_node.value[1].split(" ")) > 3):
+	var = lambda_node.data.split(" ")[1] # get variable name
+	if (len(lambda_node.data.split(" ")) > 3):
 		# if there are more lambda functions, one after another
 		# we verify if there are any more that use the same var name
 		# if so, we won't apply the function
-		for i in range (3, len(lambda_node.value[1].split(" ")), 2):
-			if lambda_node.value[1].split(" ")[i] == var:
+		for i in range (3, len(lambda_node.data.split(" ")), 2):
+			if lambda_node.data.split(" ")[i] == var:
 				var = ""
 
-	if lambda_node.children[0].value[0] == "LAMBDA":
+	if lambda_node.children[0].kind == LAMBDA:
 		# if next node is a lambda node update current lambda function variable inside
 		# the following lambda function
 		update_var(lambda_node, var, open_bracket_node.children[1])
 		return lambda_node.children[0]
 
-	if lambda_node.children[0].value[0] == "OPEN_BRACKET":
+	if lambda_node.children[0].kind == OPEN_BRACKET:
 		# if next node is an open bracket
 		update_var(lambda_node, var, open_bracket_node.children[1]) # update var with value
 		return lambda_node.children[0]
 
-	if lambda_node.children[0].value[0] == "VAR":
+	if lambda_node.children[0].kind == VAR:
 		# if the function body is a var, we verify if it is the var we are searching for
 		# we return the argument of the lambda function as a result;
 		# else we return the var as a result
-		if lambda_node.children[0].value[1] == var:
+		if lambda_node.children[0].data == var:
 			return open_bracket_node.children[1]
 		return lambda_node.children[0]
 
-	if lambda_node.children[0].value[0] == "NUM":
+	if lambda_node.children[0].kind == NUM:
 		# if the function body is a number, then its result is the same number
 		return lambda_node.children[0]
 
-def solve_tree(node):
-	if node.value[0] == "OPEN_BRACKET":
+def solve_tree_steps(node, lazy=False):
+	if node.kind == OPEN_BRACKET:
+		if type(node) is ConcatResult and node.elements is None:
+			# numbers and lists of them are solved to themselves
+			return node
+
 		# case 1: empty list
 		if not node.children:
 			return node
 
 		# case 2: concatenation
-		if node.children[0].value[0] == "CONCAT":
+		if node.children[0].kind == CONCAT:
 			concat_arg = node.children[0].children[0] # arg for the concat func
+			if lazy:
+				total = data_sum(concat_arg.children)
+				if total is not None:
+					return ConcatResult(concat_arg, total)
 			concat_result = []
 			# concatenate elements
 			for elem_to_concat in concat_arg.children:
-				if (elem_to_concat.value[0] == "OPEN_BRACKET"):
+				if (elem_to_concat.kind == OPEN_BRACKET):
 					# we have a list of elements / function to concat
 					for list_elem in elem_to_concat.children:
-						concat_result.append(solve_tree(list_elem))
+						concat_result.append((yield solve_tree_steps(list_elem, lazy)))
 				else:
 					# we concat a number
 					concat_result.append(elem_to_concat)
-			return Node(("OPEN_BRACKET", "("), concat_result) # return the concatenation result
+			return Node(OPEN_BRACKET, "(", concat_result) # return the concatenation result
 
 		# case 3: addition
-		if node.children[0].value[0] == "ADD":
+		if node.children[0].kind == ADD:
 			# calculate the sum and return it as a node
-			sum_result = calculate_sum(node.children[0])
-			return Node(("NUM", str(sum_result)), [])
+			sum_result = (yield calculate_sum_steps(node.children[0], lazy))
+			return Node(NUM, sum_result)
 
 		# case 4: lambda function
-		if node.children[0].value[0] == "LAMBDA":
+		if node.children[0].kind == LAMBDA:
 			# we encounter a lambda function / lambda functions
-			words = node.children[0].value[1].split(" ")
+			words = node.children[0].data.split(" ")
 			# verify if there are more lambda headers in this node
 			if (len(words) > 3):
 				# change current node's value (which is first lambda's open bracket) to the next
 				# lambda function header and apply the current lambda function
-				node.value = ("LAMBDA", " ".join(words[2:]))
+				node.kind = LAMBDA
+				node.data = " ".join(words[2:])
 				node.children = [apply_lambda(node)]
 			else:
 				# apply lambda on current node
 				node = apply_lambda(node)
-				node = solve_tree(node)
+				node = (yield solve_tree_steps(node, lazy))
 			return node
 
 		# else update tree recursively for each of the children of this node (list)
 		for i in range(len(node.children)):
-			node.children[i] = solve_tree(node.children[i])
+			node.children[i] = (yield solve_tree_steps(node.children[i], lazy))
 
 			# if solve_tree returned a non-called lambda function, we call it
-			if node.children[i].value[0] == "LAMBDA":
-				return solve_tree(node)
+			if node.children[i].kind == LAMBDA:
+				return (yield solve_tree_steps(node, lazy))
 
 	else:
 		# else update tree recursively for each of the children of this node
 		for i in range(len(node.children)):
-			node.children[i] = solve_tree(node.children[i])
+			node.children[i] = (yield solve_tree_steps(node.children[i], lazy))
 	return node
 
-def tree_contains_lambda(node):
-	# search the parse tree for lambda functions
-    if node.value[0] == "LAMBDA":
-        return True  # lambda function found
+def solve_tree(node, lazy=False):
+	# with lazy=True, the concat functions whose argument has only numbers and lists of them are solved to a
+	# ConcatResult, whose list of elements isn't built by the sums
+	return run_steps(solve_tree_steps(node, lazy))
 
-    for child in node.children:
-		# search recursively
-        if tree_contains_lambda(child):
-            return True
+def tree_contains_lambda(node):
+	# search the parse tree for lambda functions (with an explicit stack of the nodes to visit)
+	stack = [node]
+	while stack:
+		node = stack.pop()
+		if node.kind == LAMBDA:
+			return True # lambda function found
+		stack.extend(node.children)
+
+	return False # lambda function not found
+
+def tree_is_data(node):
+	# true if the subtree of node has only numbers and lists of them, which solve_tree leaves as they are
+	stack = [node]
+	while stack:
+		node = stack.pop()
+		if node.kind == OPEN_BRACKET:
+			stack.extend(node.children)
+		elif node.kind != NUM:
+			return False
+	return True
+
+# the places where the optimizer can find a node, from the one that allows the fewest changes:
+# UNKNOWN: the node may end up anywhere in the tree or be printed without being solved (e.g. the argument of a lambda
+# function, which is put in the body, or the body of a curried lambda function, which solve_tree doesn't solve when
+# the function is called), so nothing in its subtree can be changed
+# ELEMENTS: the node is the argument of a concat function, its children are the elements that are concatenated
+# ELEMENT: the node is an element of the argument of a concat function: the children of a list are solved, but not
+# the list itself, and the other nodes are concatenated as they are
+# SOLVED: solve_tree solves the node as a whole, so the node can be replaced with what it is solved to
+UNKNOWN, ELEMENTS, ELEMENT, SOLVED = range(4)
+
+def fold_call(node):
+	# the constant that solve_tree solves node to, node being a list that starts with an add / concat function whose
+	# arguments are constants (so they don't have to be solved again)
+	function = node.children[0]
+	if function.kind == ADD:
+		return Node(NUM, calculate_sum(function))
+	concat_result = []
+	for elem_to_concat in function.children[0].children:
+		if elem_to_concat.kind == OPEN_BRACKET:
+			concat_result.extend(elem_to_concat.children)
+		else:
+			concat_result.append(elem_to_concat)
+	return Node(OPEN_BRACKET, "(", concat_result)
+
+# simplifies the subtree of node before it is solved and returns (node, closed, data): closed is True if there are no
+# lambda functions and variables in the subtree and data is True if there are only numbers and lists of them (for an
+# add / concat function: in its arguments). the subtree is simplified bottom-up, so a node is simplified after its
+# children were, and the changes keep the result of solve_tree the same:
+# - add / concat functions on constants are replaced with their result, which is computed from the (already
+#   simplified) arguments
+# - a lambda function applied on a constant (a number / a list of numbers) is replaced with its body, in which the
+#   variable is replaced with the constant
+# - the constant lists of the argument of a concat function are merged into one list
+def optimize_tree_steps(node, place):
+	if node.kind == NUM:
+		return node, True, True
+	if node.kind == VAR:
+		return node, False, False
+
+	# the place of each child: the arguments of a concat function are its elements, the lambda functions have their
+	# body solved (except the curried ones), the arguments of lambda functions and everything after a function are
+	# UNKNOWN and the children of the nodes which are not solved or concatenated are UNKNOWN as well
+	children = node.children
+	if place == UNKNOWN or (place != SOLVED and node.kind != OPEN_BRACKET):
+		child_places = [UNKNOWN] * len(children)
+	elif place == ELEMENTS:
+		child_places = [ELEMENT] * len(children)
+	elif place == ELEMENT:
+		child_places = [SOLVED] * len(children)
+	elif node.kind == CONCAT:
+		child_places = [ELEMENTS] + [UNKNOWN] * (len(children) - 1)
+	elif node.kind == LAMBDA:
+		child_places = [SOLVED if len(node.data.split()) == 2 else UNKNOWN] * len(children)
+	elif node.kind == OPEN_BRACKET and children and children[0].kind in (ADD, CONCAT, LAMBDA):
+		child_places = [SOLVED] + [UNKNOWN] * (len(children) - 1)
+	else:
+		child_places = [SOLVED] * len(children)
+
+	closed = node.kind != LAMBDA
+	data = node.kind in (OPEN_BRACKET, ADD, CONCAT)
+	first_closed = first_data = False
+	for i in range(len(children)):
+		child_place = child_places[i]
+		if i and child_place == SOLVED and place == SOLVED and node.kind == OPEN_BRACKET and not first_closed:
+			# if the first element of a list is solved to a lambda function, the list becomes a call of it and the
+			# other elements are its arguments
+			child_place = UNKNOWN
+		child, child_closed, child_data = (yield optimize_tree_steps(children[i], child_place))
+		children[i] = child
+		closed = closed and child_closed
+		if i == 0:
+			first_closed, first_data = child_closed, child_data
+		if node.kind == CONCAT:
+			# only the first argument of a concat function is used
+			data = data and (i > 0 or child_data)
+		else:
+			data = data and child_data and (node.kind == ADD or child.kind not in (ADD, CONCAT))
+	if node.kind == CONCAT and not children:
+		data = False
+
+	if place != SOLVED or node.kind != OPEN_BRACKET or data or not children:
+		return node, closed, data
+
+	if children[0].kind in (ADD, CONCAT) and first_data:
+		return fold_call(node), True, True
+
+	if children[0].kind == CONCAT and children[0].children and children[0].children[0].kind == OPEN_BRACKET:
+		# merge the constant elements that follow one another in the argument of the concat function (only if the
+		# argument starts with a constant, so it stays a list of elements and not a call)
+		concat_arg = children[0].children[0]
+		if concat_arg.children and tree_is_data(concat_arg.children[0]):
+			elements = []
+			merged = None # the new list the constant elements are added to
+			for elem_to_concat in concat_arg.children:
+				if not tree_is_data(elem_to_concat):
+					elements.append(elem_to_concat)
+					merged = None
+					continue
+				if merged is None:
+					merged = Node(OPEN_BRACKET, "(", [])
+					elements.append(merged)
+				if elem_to_concat.kind == OPEN_BRACKET:
+					merged.children.extend(elem_to_concat.children)
+				else:
+					merged.children.append(elem_to_concat)
+			# the argument may be shared with other places (if it came from a lambda function's argument), so it is
+			# replaced with a new list instead of being changed
+			children[0].children[0] = Node(OPEN_BRACKET, "(", elements)
+
+	elif children[0].kind == LAMBDA and len(children) == 2 and children[0].children:
+		lambda_node = children[0]
+		words = lambda_node.data.split(" ")
+		body = lambda_node.children[0]
+		# a single lambda header, applied on a constant, whose body is not another lambda function
+		if len(words) == 3 and body.kind != LAMBDA and tree_is_data(children[1]):
+			if body.kind == OPEN_BRACKET:
+				update_var(lambda_node, words[1], children[1])
+				body = lambda_node.children[0]
+			elif body.kind == VAR and body.data == words[1]:
+				body = children[1]
+			# the body may be simplified further now that it has the value of the variable
+			return (yield optimize_tree_steps(body, SOLVED))
+
+	return node, closed, False
+
+def optimize_tree(tree):
+	return run_steps(optimize_tree_steps(tree, SOLVED))[0]
+
+def output_fragments(node, output_string=""):
+	# visit each node in the modified tree and yield the pieces of the output string, in order
+	# (output_string is the output which was already written before this node, if any);
+	# the tree is walked with an explicit stack of (node, closing), closing being True for the end of a list
+	empty = output_string == "" # true as long as nothing was added to the output
+	last_char = output_string[-1:] # the last character of the output
+	stack = [(node, False)]
+	while stack:
+		node, closing = stack.pop()
+		if closing:
+			# close the list
+			yield ")" if empty or last_char == "(" else " )"
+			empty = False
+			last_char = ")"
+			continue
 
-    return False # lambda function not found
+		if node.kind == OPEN_BRACKET:
+			# start the list
+			yield "(" if empty else " ("
+			empty = False
+			last_char = "("
+			stack.append((node, True))
+		elif node.kind == NUM:
+			# save the number to the output
+			number = str(node.data)
+			yield number if empty else " " + number
+			empty = False
+			last_char = number[-1]
+		# visit node's children
+		stack.extend((child, False) for child in reversed(node.children))
 
 def create_output_string(node, depth=0, output_string=""):
-	# visit each node in the modified tree and save the value of the node to the output string
-	if node.value[0] == "OPEN_BRACKET":
-		# start the list
-		if output_string != "":
-			output_string += " "
-		output_string += "("
-	elif node.value[0] == "NUM":
-		# save the number to the output
-		if output_string != "":
-			output_string += " "
-		output_string += node.value[1]
-	for child in node.children:
-		# visit node's children recursively
-		output_string = create_output_string(child, depth + 1, output_string)
-	if node.value[0] == "OPEN_BRACKET":
-		# close the list
-		if output_string != "" and output_string[len(output_string) - 1] != "(":
-			output_string += " "
-		output_string += ")"
-
-	return output_string
+	# the fragments of the output are joined only once, at the end
+	return output_string + "".join(output_fragments(node, output_string))
+
+def write_output(node, file=None, batch_size=4096):
+	# writes the output of the tree (the same text as create_output_string) to file (sys.stdout by default) while the
+	# tree is walked, batch_size fragments at a time, so the whole output never has to be held in memory
+	if file is None:
+		file = sys.stdout
+	batch = []
+	for fragment in output_fragments(node):
+		batch.append(fragment)
+		if len(batch) == batch_size:
+			file.write("".join(batch))
+			batch.clear()
+	file.write("".join(batch))
+
+def mmap_tokens(lexer, filename, skip=()):
+	# lex the file directly over an mmap of its bytes (without reading it into a string), using lex_spans;
+	# only the text of the tokens that are not skipped is decoded, and the tokens are yielded the same way lex_stream does
+	with open(filename, 'rb') as file:
+		if os.fstat(file.fileno()).st_size == 0:
+			return
+		with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+			for token, start, end in lexer.lex_spans(buffer, skip):
+				if token == "":
+					yield ("", error_message(buffer, start))
+				else:
+					yield (token, buffer[start:end].decode())
+
+# the specification of the tokens of L, using regex
+SPEC = [("SPACE", "(\\ *\n*\t*)+"), ("NUM", "[0-9]+"), ("OPEN_BRACKET", "\\("), ("CLOSE_BRACKET", "\\)"),
+	("ADD", "\\+"), ("CONCAT", "\\+\\+"), ("LAMBDA", "lambda"), ("VAR", "([a-z]*[A-Z]*)+"), ("LAMBDA_START", ":")]
+
+# the options that can be given before the filenames:
+# "--mmap": the file is lexed over an mmap of it instead of being read in chunks
+# "--env": the program is evaluated with the environment based evaluator (see Evaluator.py) instead of solve_tree,
+# with the same output; the programs where an argument would be shared are still solved with solve_tree
+# "--vm": the program is compiled to flat code (see VM.py) which is run like --env
+# "--optimize": the tree is simplified with optimize_tree before it is processed
+# "--dump-tree": the tree that is processed (after optimize_tree, if it is used) is printed to stderr
+# "--memo": the equal subtrees are shared (see Parser.share_subtrees) and the program is evaluated like with --env,
+# caching the results of the closed lists; the hits and misses of the cache are printed to stderr
+# "--lazy": the program is solved by solve_tree with lazy=True: the concatenations of numbers and lists of them are
+# only built if they are printed, a sum adds their numbers without building them
+# "--jobs N": the files are run in batch mode (see run_batch) by N worker processes
+OPTIONS = {"--mmap", "--env", "--vm", "--optimize", "--dump-tree", "--memo", "--lazy"}
+
+def run_file(lexer, filename, options):
+	# lexes, parses and processes the program in filename with the given options and returns the resulting tree
+	# we will create a parse tree, while the tokens are lexed (we skip SPACE matched strings)
+	if "--mmap" in options:
+		tree = parse_program(mmap_tokens(lexer, filename, skip={"SPACE"}))
+	else:
+		with open(filename, 'r') as file:
+			# open the file and lex its content in chunks using the lex_stream function on a Lexer object
+			tree = parse_program(lexer.lex_stream(file, skip={"SPACE"}))
+	return process_tree(tree, options)
+
+def process_tree(tree, options):
+	# processes a parse tree the way run_file does with the given options and returns the resulting tree
+	if "--optimize" in options:
+		tree = optimize_tree(tree)
+	if "--dump-tree" in options:
+		sys.stderr.write(repr(tree))
+
+	# process the tree
+	if "--memo" in options:
+		memo = Memo()
+		tree = share_subtrees(tree)
+		try:
+			tree = evaluate_tree(tree, memo)
+		except SharedValue:
+			# solve_tree changes the nodes, so it gets a copy of the tree without shared nodes
+			tree = solve_tree(copy_tree(tree))
+		sys.stderr.write("memo: %d hits, %d misses\n" % (memo.hits, memo.misses))
+	elif "--env" in options or "--vm" in options:
+		try:
+			tree = evaluate_tree(tree) if "--env" in options else run_tree(tree)
+		except SharedValue:
+			# the evaluator gave up (see Evaluator.py), the tree wasn't changed
+			tree = solve_tree(tree)
+	else:
+		tree = solve_tree(tree, "--lazy" in options)
+	return tree
+
+# the lexer of a worker process of run_batch
+worker_lexer = None
+
+def init_worker(spec, table, state_tokens):
+	# creates the lexer of a worker process from the compiled table of the lexer of the main process (a forked worker
+	# gets the arguments without copying them, otherwise only the table is pickled, not the automata)
+	global worker_lexer
+	worker_lexer = Lexer.from_table(spec, table, state_tokens)
+
+def run_worker_file(filename, options):
+	# runs a file in a worker process and returns (True, output string) or (False, error message)
+	try:
+		return True, create_output_string(run_file(worker_lexer, filename, options))
+	except Exception as error:
+		return False, "%s: %s: %s" % (filename, type(error).__name__, error)
+
+def batch_filenames(paths):
+	# the files to run for the paths given to the batch mode: a directory stands for the files in it, sorted by name
+	for path in paths:
+		if os.path.isdir(path):
+			for name in sorted(os.listdir(path)):
+				if os.path.isfile(os.path.join(path, name)):
+					yield os.path.join(path, name)
+		else:
+			yield path
+
+def run_batch(lexer, filenames, options, jobs=None):
+	# runs many files with a pool of jobs worker processes (os.cpu_count() by default) which share the lexer; the
+	# files are given to the workers in chunks and the output of each file (or its error, on stderr) is written in
+	# the order of filenames. returns the number of files that failed
+	jobs = jobs or os.cpu_count() or 1
+	context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+	chunk_size = max(1, len(filenames) // (jobs * 4))
+	failed = 0
+	with ProcessPoolExecutor(jobs, mp_context=context, initializer=init_worker,
+							 initargs=(lexer.spec, lexer.table, lexer.state_tokens)) as executor:
+		for ok, text in executor.map(run_worker_file, filenames, [options] * len(filenames), chunksize=chunk_size):
+			if ok:
+				sys.stdout.write(text + "\n")
+			else:
+				failed += 1
+				sys.stdout.flush()
+				sys.stderr.write(text + "\n")
+				sys.stderr.flush()
+	return failed
+
+def usage_error(message):
+	# the command line is invalid: the error and the usage are written to stderr and the exit status is 2
+	options = " ".join("[%s]" % option for option in sorted(OPTIONS))
+	sys.stderr.write("error: %s\nusage: main %s FILENAME\n       main %s [--jobs N] FILENAME|DIRECTORY...\n"
+					 % (message, options, options))
+	sys.exit(2)
 
 def main():
-	if len(argv) != 2:
+	# usage: [OPTIONS] FILENAME, or [OPTIONS] [--jobs N] FILENAME|DIRECTORY... for the batch mode, which is used when
+	# --jobs is given, there are several filenames or a directory
+	args = argv[1:]
+	jobs = None
+	if "--jobs" in args:
+		i = args.index("--jobs")
+		if i + 1 >= len(args) or not args[i + 1].isdigit():
+			usage_error("--jobs needs a number of worker processes")
+		jobs = int(args[i + 1])
+		del args[i:i + 2]
+	options = set()
+	while args and args[0] in OPTIONS:
+		options.add(args.pop(0))
+	if not args:
+		usage_error("no file given")
+	for arg in args:
+		if arg.startswith("--"):
+			usage_error(("option %s after the filenames" if arg in OPTIONS or arg == "--jobs" else "unknown option %s")
+						% arg)
+
+	lexer = Lexer.from_spec(SPEC)
+	if jobs is None and len(args) == 1 and not os.path.isdir(args[0]):
+		try:
+			tree = run_file(lexer, args[0], options)
+		except LexerError as error:
+			# the program couldn't be lexed: the error is reported the same way as in batch mode
+			sys.stderr.write("%s: %s: %s\n" % (args[0], type(error).__name__, error))
+			sys.exit(1)
+		# write the output of the tree to stdout
+		write_output(tree)
+		sys.stdout.write("\n")
 		return
-	
-	filename = argv[1]
-	# define the specification using regex
-	spec = [("SPACE", "(\\ *\n*\t*)+"), ("NUM", "[0-9]+"), ("OPEN_BRACKET", "\\("), ("CLOSE_BRACKET", "\\)"),
-		 ("ADD", "\\+"), ("CONCAT", "\\+\\+"), ("LAMBDA", "lambda"), ("VAR", "([a-z]*[A-Z]*)+"), ("LAMBDA_START", ":")]
-
-	with open(filename, 'r') as file:
-		# open the file, read the content, use the lex function on a Lexer object to get the tokens (we skip SPACE matched strings)
-		file_content = file.read()
-		parsed_content = [token for token in Lexer(spec).lex(file_content) if token[0] != "SPACE"]
-
-		# we will create a parse tree
-		tree = Node(("START", "START"), []) # the root node will be "START"
-		tree.parse_tokens(parsed_content) # create the tree using parse_tokens function
-
-		# process the tree
-		tree = solve_tree(tree)
-
-		# create the output string and print it
-		output_string = create_output_string(tree)
-		print(output_string)
+
+	if run_batch(lexer, list(batch_filenames(args)), options, jobs):
+		sys.exit(1)
 
 if __name__ == '__main__':
     main()